@@ -8,26 +8,45 @@ file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
 from dataset_config import *
+from records import read_records, sample_index
 
 
 class Annotation:
 	"""
 	Class that writes an annotation based on Pix3D dataset structure from an
-	active 3D scene.
+	active 3D scene. With a stream file every sample is appended to it as a
+	JSON line as soon as it is added, instead of being kept in memory until
+	the end of the run.
 
 	"""
-	def __init__(self):
+	def __init__(self, stream=None, sync=ANNOTATION_SYNC):
+		"""
+		Class initialization.
+		:param stream: path of the .jsonl file to append the samples to, str,
+		default None - keep the samples in memory
+		:param sync: number of samples after which the stream file is synced to
+		disk, int
+		"""
 		self.content = {}
 		self.full = []
+		self.stream = stream
+		self.sync = max(1, sync)
+		self._file = None
+		self._unsynced = 0
+		if self.stream:
+			self._open()
 		self._clean()
 
-	def add(self, building, name, model):
+	def add(self, building, name, model, commit=True):
 		"""
 		Function that adds a model's annotation to the full dataset annotation.
 		:param building: building to add to json, Building class
 		:param name: name of the image file, str
 		:param model: name of the model .obj file, str
-		:return:
+		:param commit: whether to add the record right away, bool, default True,
+		False - the record is added later with commit, e.g. once the outputs of
+		the sample are written
+		:return: annotation of the model, dict
 		"""
 		assert isinstance(name, str)
 
@@ -57,21 +76,118 @@ class Annotation:
 		self.content['img_size'] = (bpy.data.scenes[0].render.resolution_y,
 		                            bpy.data.scenes[0].render.resolution_x)
 		self.content['bbox'] = building.get_bb()
-		self.full.append(self.content)
+		record = self.content
+		if commit:
+			self.commit(record)
 		self._clean()
+		return record
+
+	def commit(self, record):
+		"""
+		Function that adds a record made by add to the annotation.
+		:param record: annotation of the model, dict
+		:return:
+		"""
+		if self._file:
+			self._append(record)
+		else:
+			self.full.append(record)
+
+	def close(self):
+		"""
+		Function that syncs and closes the stream file.
+		:return:
+		"""
+		if self._file:
+			self._flush()
+			self._file.close()
+			self._file = None
+
+	def compact(self, filename):
+		"""
+		Function that writes the samples of the stream file as a single json
+		annotation ordered by sample index. If a sample was added several times
+		the last record is kept.
+		:param filename: name of the file to write, str
+		:return:
+		"""
+		self.close()
+		self._dump(self.read(), filename)
+
+	def read(self):
+		"""
+		Function that reads the samples written so far.
+		:return: annotations, list of dict
+		"""
+		if not self.stream:
+			return list(self.full)
+		if self._file:
+			self._flush()
+		return read_records(self.stream)
 
 	def write(self, filename='test.json'):
 		"""
-		Function that writes the full json annotation to the provided location.
+		Function that writes the full json annotation to the provided location,
+		ordered by sample index. If a sample was added several times, e.g. by a
+		resumed run, the last record is kept.
 		:param filename: name of the file to write, str, default='test.json'
 		:return:
 		"""
 		assert isinstance(filename, str), 'Expected filename to be str, got {}'.format(type(filename))
-		with open(filename, 'w') as f:
-			json.dump(self.full, f)
+		if self.stream:
+			self.compact(filename)
+		else:
+			self._dump(self.full, filename)
 
 		print('Annotation successfully written as {}'.format(filename))
 
+	def _append(self, record):
+		"""
+		Function that appends a sample to the stream file.
+		:param record: annotation of the sample, dict
+		:return:
+		"""
+		self._file.write(json.dumps(record) + '\n')
+		self._file.flush()
+		self._unsynced += 1
+		if self._unsynced >= self.sync:
+			self._flush()
+
+	def _dump(self, records, filename):
+		"""
+		Function that writes the last record of every sample as a json
+		annotation ordered by sample index.
+		:param records: annotations, list of dict
+		:param filename: name of the file to write, str
+		:return:
+		"""
+		records = {sample_index(x): x for x in records}
+		with open(filename, 'w') as f:
+			json.dump([records[x] for x in sorted(records)], f)
+
+	def _flush(self):
+		"""
+		Function that syncs the stream file to disk.
+		:return:
+		"""
+		self._file.flush()
+		os.fsync(self._file.fileno())
+		self._unsynced = 0
+
+	def _open(self):
+		"""
+		Function that opens the stream file for appending. A last line left
+		incomplete by an interrupted run is cut off, so that the samples of a
+		resumed run start on a new line.
+		:return:
+		"""
+		if os.path.isfile(self.stream):
+			with open(self.stream, 'rb+') as f:
+				data = f.read()
+				if data and not data.endswith(b'\n'):
+					f.truncate(data.rfind(b'\n') + 1)
+		self._file = open(self.stream, 'a')
+
 	def _clean(self):
 		"""
 		Function that returns the annotation template to its default form.
@@ -1,7 +1,7 @@
 import bpy, bmesh
 from copy import copy
 import math
-from mathutils import Vector
+from mathutils import Euler, Vector
 from mathutils.bvhtree import BVHTree
 import numpy as np
 import os
@@ -10,7 +10,63 @@ import sys
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
-from iou import IoU3D, Intersection
+from bounds import get_bounds, invalidate, is_box, world_matrix
+from dataset_config import IOU_CHECK
+from iou import BoxIntersection, IoU3D, Intersection, box_intersection
+from spec import attach
+
+
+# faces of a box as quads with outward normals, and the axes of their UVs
+_BOX_CORNERS = np.array([[-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],
+                         [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1]])
+_BOX_QUADS = np.array([[0, 3, 2, 1], [4, 5, 6, 7], [0, 1, 5, 4],
+                       [1, 2, 6, 5], [2, 3, 7, 6], [3, 0, 4, 7]])
+_BOX_UV_AXES = np.array([[0, 1], [0, 1], [0, 2], [1, 2], [0, 2], [1, 2]])
+
+
+def box_mesh(name, size, location=(0.0, 0.0, 0.0), triangulate=True):
+	"""
+	Function that creates a box object directly from NumPy vertex and face
+	arrays, without operators or mode switches. The UVs are projected on every
+	face and share one scale, so that textures are not stretched.
+	:param name: name of the object and its mesh, str
+	:param size: size of the box along x, y, z, iterable of float
+	:param location: location of the center of the box, iterable of float,
+	default (0.0, 0.0, 0.0)
+	:param triangulate: whether to split the faces into triangles, bool,
+	default True
+	:return: box linked to the active collection, blender object
+	"""
+	size = np.asarray(size, dtype=np.float64)
+	vertices = _BOX_CORNERS * size / 2
+	uvs = np.take_along_axis(vertices[_BOX_QUADS], _BOX_UV_AXES[:, None, :],
+	                         axis=2)
+	uvs = (uvs + size[_BOX_UV_AXES][:, None, :] / 2) / size.max()
+	faces = _BOX_QUADS
+	if triangulate:
+		faces = faces[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+		uvs = uvs[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3, 2)
+
+	mesh = bpy.data.meshes.new(name)
+	mesh.from_pydata(vertices.tolist(), [], faces.tolist())
+	uv_layer = mesh.uv_layers.new(name='UVMap')
+	uv_layer.data.foreach_set('uv', uvs.astype(np.float32).ravel())
+	mesh.update()
+	obj = bpy.data.objects.new(name, mesh)
+	obj.location = location
+	bpy.context.collection.objects.link(obj)
+	return obj
+
+
+def triangulated(obj):
+	"""
+	Function that checks whether all the faces of a mesh are triangles.
+	:param obj: mesh object, blender object
+	:return: result, bool
+	"""
+	totals = np.empty(len(obj.data.polygons), dtype=np.int32)
+	obj.data.polygons.foreach_get('loop_total', totals)
+	return bool((totals == 3).all())
 
 
 def deselect_all():
@@ -71,6 +127,34 @@ def extrude(mesh, height, direction=-1):
 
 	# Origin to center
 	bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
+	invalidate(mesh)
+
+
+def frame(camera, bounds, margin=1.05):
+	"""
+	Function that moves the camera along its view direction so that a bounding
+	box is entirely in the frame. Replaces bpy.ops.view3d.camera_to_view_selected
+	which needs a VIEW_3D area.
+	:param camera: camera to move, blender camera object
+	:param bounds: bounding box to frame, list of float
+	[x_min, y_min, z_min, x_max, y_max, z_max]
+	:param margin: relative margin around the bounding box, float, default 1.05
+	:return:
+	"""
+	assert len(bounds) == 6, "Expected 6 bounding box coordinates, " \
+	                         "got {}".format(len(bounds))
+	_min, _max = Vector(bounds[:3]), Vector(bounds[3:])
+	radius = 0.5 * (_max - _min).length * margin
+	render = bpy.context.scene.render
+	aspect = (render.resolution_x * render.pixel_aspect_x) / \
+	         (render.resolution_y * render.pixel_aspect_y)
+	angle = camera.data.angle
+	if aspect >= 1:
+		angle = 2 * math.atan(math.tan(angle / 2) / aspect)
+	else:
+		angle = 2 * math.atan(math.tan(angle / 2) * aspect)
+	direction = camera.rotation_euler.to_matrix() @ Vector((0.0, 0.0, -1.0))
+	camera.location = (_min + _max) / 2 - direction * (radius / math.sin(angle / 2))
 
 
 def get_min_max(volume, axis):
@@ -81,12 +165,8 @@ def get_min_max(volume, axis):
 	:param axis: int, 0 - width; 1 - length; 2 - height
 	:return: min, max, float
 	"""
-	bpy.context.view_layer.update()
-	bb_vertices = [Vector(v) for v in volume.bound_box]
-	mat = volume.matrix_world
-	world_bb_vertices = [mat @ v for v in bb_vertices]
-	return min([x[axis: axis + 1][0] for x in world_bb_vertices]), \
-		   max([x[axis: axis + 1][0] for x in world_bb_vertices])
+	bounds = get_bounds(volume)
+	return float(bounds[0, axis]), float(bounds[1, axis])
 
 def gancio(v1, v2, axis, border1=0, border2=0):
 	"""
@@ -99,16 +179,24 @@ def gancio(v1, v2, axis, border1=0, border2=0):
 	:param border2: max or min side of the opposite axis, 0 - min, 1 - max
 	:return:
 	"""
-	mapping = {0: -1, 1: 1}
 	coords1 = [get_min_max(v1.mesh, 0), get_min_max(v1.mesh, 1)]
 	coords2 = [get_min_max(v2.mesh, 0), get_min_max(v2.mesh, 1)]
 
-	v2.mesh.location[axis] = coords1[axis][border1] + \
-							 (0.5 * np.diff(coords2[axis]) * mapping[border1])
+	v2.mesh.location[axis], v2.mesh.location[abs(1 - axis)] = attach(
+		coords1, [np.diff(x)[0] for x in coords2], axis, border1, border2)
+
+def intersection(v1, v2):
+	"""
+	Function that returns the intersection metric of two volumes for IOU_CHECK:
+	closed form for boxes with 'box', boolean modifiers with 'boolean'.
+	:param v1: first volume, Volume or Module
+	:param v2: second volume, Volume or Module
+	:return: metric, Intersection or BoxIntersection
+	"""
+	if IOU_CHECK == 'box':
+		return BoxIntersection(v1, v2)
+	return Intersection(v1, v2)
 
-	v2.mesh.location[abs(1 - axis)] = coords1[abs(1 - axis)][border2] + \
-									  mapping[abs(1 - border2)] * np.diff(coords1[abs(1 - axis)]) + \
-									  (0.5 * np.diff(coords2[abs(1-axis)]) * mapping[border2])
 
 def gancio2(v1, v2, axis, border1=0, border2=0):
 	"""
@@ -125,9 +213,12 @@ def gancio2(v1, v2, axis, border1=0, border2=0):
 	v2.mesh.rotation_euler[2] = 0
 	v2.mesh.location[2] = 0
 	place(v1, v2, axis, border1, border2)
+	if IOU_CHECK == 'box' and is_box(v1.mesh) and is_box(v2.mesh):
+		_rotate(v1, v2, axis, border1, border2)
+		return
 	_intersections = []
 
-	iou = Intersection(v1, v2)
+	iou = intersection(v1, v2)
 
 	for i in range(8):
 
@@ -155,6 +246,36 @@ def gancio2(v1, v2, axis, border1=0, border2=0):
 	place(v1, v2, axis, border1, border2)
 
 
+def _rotate(v1, v2, axis, border1=0, border2=0):
+	"""
+	Function that chooses the rotation of an attached volume with the smallest
+	intersection with the other volume. All the 8 candidate rotations of gancio2
+	are scored at once on the bounding boxes.
+	:param v1: volume to attach the other volume to, Volume or Module
+	:param v2: volume to attach to the other volume, Volume or Module
+	:param axis: axis along which the volume will be attached, bool, 0 - x axis,
+																	   1 - y axis
+	:param border1: max or min side of the axis, 0 - min, 1 - max
+	:param border2: max or min side of the opposite axis, 0 - min, 1 - max
+	:return:
+	"""
+	location = np.array(v2.mesh.location)
+	location[abs(1 - axis)] += 0.5 if border2 == 1 else -0.5
+	corners = np.array(v2.mesh.bound_box) * np.array(v2.mesh.scale)
+	_rotation = list(v2.mesh.rotation_euler)
+	candidates = []
+	for i in range(8):
+		_rotation[2] = np.radians(90) * (i + 1)
+		mat = np.array(Euler(_rotation, v2.mesh.rotation_mode).to_matrix())
+		_corners = corners @ mat.T + location
+		candidates.append([_corners.min(axis=0), _corners.max(axis=0)])
+	inter = box_intersection(get_bounds(v1.mesh), np.array(candidates))
+	# same rule as gancio2: first of the last 4 rotations matching the minimum
+	i = 4 + int(np.flatnonzero(np.isclose(inter[4:], inter[:4].min()))[0])
+	v2.mesh.rotation_euler[2] = np.radians(90) * (i + 1) - np.radians(360)
+	place(v1, v2, axis, border1, border2)
+
+
 def gancio3(v1, v2, axis, border1=0, border2=0):
 	"""
 	Function that attaches one volume to another one based on condition.
@@ -171,7 +292,7 @@ def gancio3(v1, v2, axis, border1=0, border2=0):
 	place(v1, v2, axis, border1, border2)
 	_intersections = []
 
-	iou = Intersection(v1, v2)
+	iou = intersection(v1, v2)
 
 	for i in range(8):
 
@@ -219,8 +340,8 @@ def intersection_check(v1, v2):
 	bm2.from_mesh(v2.data)
 
 	#fixed it here:
-	bm1.transform(v1.matrix_world)
-	bm2.transform(v2.matrix_world)
+	bm1.transform(world_matrix(v1))
+	bm2.transform(world_matrix(v2))
 
 	#make BVH tree from BMesh of objects
 	v1_BVHtree = BVHTree.FromBMesh(bm1)
@@ -230,6 +351,129 @@ def intersection_check(v1, v2):
 	inter = v1_BVHtree.overlap(v2_BVHtree)
 	return inter
 
+def mesh_arrays(objects):
+	"""
+	Function that reads the triangles of the evaluated meshes of the given
+	objects into NumPy arrays in world coordinates, without exporting them.
+	:param objects: objects to read, non-mesh objects are skipped, iterable of
+	blender object
+	:return: arrays, dict:
+	'vertices' - np.ndarray (N, 3) float32, world coordinates
+	'triangles' - np.ndarray (M, 3) int, indices in 'vertices'
+	'objects' - np.ndarray (M,) int, index of the object of every triangle
+	'names' - list of str, names of the objects
+	'ids' - np.ndarray (K,) int, semantic id of every object, its "inst_id"
+	property or pass index
+	"""
+	depsgraph = bpy.context.evaluated_depsgraph_get()
+	vertices, triangles, owners, names, ids = [], [], [], [], []
+	offset = 0
+	for obj in objects:
+		if obj.type != 'MESH':
+			continue
+		_eval = obj.evaluated_get(depsgraph)
+		mesh = _eval.to_mesh()
+		mesh.calc_loop_triangles()
+		co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+		mesh.vertices.foreach_get('co', co)
+		tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+		mesh.loop_triangles.foreach_get('vertices', tris)
+		mat = np.array(_eval.matrix_world, dtype=np.float32)
+		vertices.append(co.reshape(-1, 3) @ mat[:3, :3].T + mat[:3, 3])
+		triangles.append(tris.reshape(-1, 3) + offset)
+		owners.append(np.full(len(tris) // 3, len(names), dtype=np.int32))
+		names.append(obj.name)
+		ids.append(obj.get('inst_id', obj.pass_index))
+		offset += len(co) // 3
+		_eval.to_mesh_clear()
+	if not names:
+		return {'vertices': np.zeros((0, 3), dtype=np.float32),
+		        'triangles': np.zeros((0, 3), dtype=np.int32),
+		        'objects': np.zeros(0, dtype=np.int32), 'names': [],
+		        'ids': np.zeros(0, dtype=np.int32)}
+	return {'vertices': np.concatenate(vertices).astype(np.float32),
+	        'triangles': np.concatenate(triangles),
+	        'objects': np.concatenate(owners),
+	        'names': names,
+	        'ids': np.array(ids, dtype=np.int32)}
+
+
+def purge(name='Building'):
+	"""
+	Function that removes all the objects and child collections of a collection
+	and then the meshes, materials and images of these objects that are left
+	without users, so that names and name-based lookups do not grow from one
+	building to the next. Other data-blocks of the file are not touched.
+	:param name: name of the collection to empty, str, default 'Building'
+	:return:
+	"""
+	collection = bpy.data.collections[name]
+	objects = list(collection.all_objects)
+	blocks = []  # data-blocks of the building, collected before the objects go
+	for obj in objects:
+		if obj.data is not None:
+			blocks.append(obj.data)
+			blocks += [x for x in getattr(obj.data, 'materials', []) if x]
+		blocks += [x.material for x in obj.material_slots if x.material]
+	for material in [x for x in blocks if isinstance(x, bpy.types.Material)]:
+		if material.node_tree is not None:
+			blocks += [x.image for x in material.node_tree.nodes
+			           if getattr(x, 'image', None) is not None]
+	for obj in objects:
+		bpy.data.objects.remove(obj, do_unlink=True)
+	children = list(collection.children_recursive) if \
+		hasattr(collection, 'children_recursive') else _children(collection)
+	for child in children:
+		bpy.data.collections.remove(child)
+	invalidate()
+	purge_orphans(blocks)
+
+
+def purge_orphans(blocks):
+	"""
+	Function that removes the given meshes, materials and images that have no
+	users. Data-blocks with a fake user (e.g. loaded materials) are kept.
+	:param blocks: data-blocks to remove if unused, list of bpy ID
+	:return: number of removed data-blocks, int
+	"""
+	data = [(bpy.types.Mesh, bpy.data.meshes),
+	        (bpy.types.Material, bpy.data.materials),
+	        (bpy.types.Image, bpy.data.images)]
+	pending = {}
+	for block in blocks:
+		for kind, collection in data:
+			if isinstance(block, kind):
+				pending[block.as_pointer()] = (block, collection)
+	total = 0
+	removed = 1
+	while removed:  # removing meshes can leave their materials without users
+		removed = 0
+		for key, (block, collection) in list(pending.items()):
+			try:
+				if block.users == 0:
+					collection.remove(block)
+					removed += 1
+				else:
+					continue
+			except ReferenceError:
+				pass
+			del pending[key]
+		total += removed
+	return total
+
+
+def _children(collection):
+	"""
+	Function that lists the child collections of a collection recursively.
+	:param collection: collection, blender collection
+	:return: children, list of blender collection
+	"""
+	children = []
+	for child in collection.children:
+		children += [child] + _children(child)
+	return children
+
+
 def select(_volume):
 	_volume.select_set(True)
 	bpy.context.view_layer.objects.active = _volume
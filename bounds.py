@@ -0,0 +1,121 @@
+import bpy
+import numpy as np
+
+_cache = {}  # object pointer: (transform key, bounds)
+
+
+def get_bounds(obj):
+	"""
+	Function that returns the world-space axis-aligned bounding box of an object.
+	For objects without a parent the transform is built from the location,
+	rotation and scale, so no view layer update is needed, and the result is
+	cached until one of them changes. In-place edits of a mesh that keep its
+	vertex count and removed objects are not detected: call invalidate.
+	:param obj: object to get the bounds of, blender object
+	:return: bounds, read-only np.ndarray (2, 3), [[x_min, y_min, z_min],
+	[x_max, y_max, z_max]]
+	"""
+	if obj.parent is not None:
+		return _get_bounds(obj)
+	key = _key(obj)
+	cached = _cache.get(obj.as_pointer())
+	if cached is not None and cached[0] == key:
+		return cached[1]
+	bounds = _get_bounds(obj)
+	_cache[obj.as_pointer()] = (key, bounds)
+	return bounds
+
+
+def invalidate(obj=None):
+	"""
+	Function that drops cached bounds, e.g. after the mesh of an object was
+	edited or objects were deleted.
+	:param obj: object to drop the bounds of, blender object, default None - all
+	:return:
+	"""
+	if obj is None:
+		_cache.clear()
+	else:
+		_cache.pop(obj.as_pointer(), None)
+
+
+def world_matrix(obj):
+	"""
+	Function that returns the world matrix of an object. For objects without a
+	parent it is built from the location, rotation and scale, so no view layer
+	update is needed.
+	:param obj: object, blender object
+	:return: world matrix, mathutils Matrix
+	"""
+	if obj.parent is None:
+		return obj.matrix_basis
+	bpy.context.view_layer.update()
+	return obj.matrix_world
+
+
+def is_box(obj, tolerance=1e-4):
+	"""
+	Function that checks whether an object is described by its bounding box:
+	it is rotated by multiples of 90 degrees and is not marked as another shape
+	with the custom property "box".
+	:param obj: object to check, blender object
+	:param tolerance: angular tolerance in radians, float, default 1e-4
+	:return: result, bool
+	"""
+	if not obj.get("box", 1):
+		return False
+	angles = np.mod(np.array(obj.rotation_euler), np.pi / 2)
+	return bool(np.all(np.minimum(angles, np.pi / 2 - angles) < tolerance))
+
+
+def overlap(bounds, others):
+	"""
+	Function that checks which bounding boxes overlap a given one with
+	vectorised interval tests. Touching boxes do not overlap.
+	:param bounds: bounding box, np.ndarray (2, 3)
+	:param others: bounding boxes to check, np.ndarray (N, 2, 3)
+	:return: results, np.ndarray (N,) of bool
+	"""
+	others = np.asarray(others).reshape(-1, 2, 3)
+	return np.all((others[:, 0] < bounds[1]) & (others[:, 1] > bounds[0]), axis=1)
+
+
+def _get_bounds(obj):
+	"""
+	Function that computes the world-space bounding box of an object with one
+	matrix multiplication of the 8 corners of its local bounding box. The local
+	box of a mesh is read from its vertices, which are up to date after an
+	edit, unlike bound_box before the next view layer update.
+	:param obj: object to get the bounds of, blender object
+	:return: bounds, read-only np.ndarray (2, 3)
+	"""
+	mat = np.array(world_matrix(obj))
+	vertices = getattr(obj.data, 'vertices', None)
+	if vertices is not None and len(vertices):
+		co = np.empty(len(vertices) * 3, dtype=np.float64)
+		vertices.foreach_get('co', co)
+		co = co.reshape(-1, 3)
+		_min, _max = co.min(axis=0), co.max(axis=0)
+		corners = np.array([[x, y, z] for x in (_min[0], _max[0])
+		                    for y in (_min[1], _max[1]) for z in (_min[2], _max[2])])
+	else:
+		bpy.context.view_layer.update()
+		corners = np.array(obj.bound_box)
+	corners = corners @ mat[:3, :3].T + mat[:3, 3]
+	bounds = np.array([corners.min(axis=0), corners.max(axis=0)])
+	bounds.flags.writeable = False
+	return bounds
+
+
+def _key(obj):
+	"""
+	Function that returns the values the bounds of an object depend on.
+	:param obj: object, blender object
+	:return: key, tuple
+	"""
+	_data = obj.data
+	return (obj.name, tuple(obj.location), tuple(obj.rotation_euler),
+	        tuple(obj.scale), obj.rotation_mode,
+	        _data.as_pointer() if _data is not None else 0,
+	        _data.name if _data is not None else '',
+	        len(_data.vertices) if hasattr(_data, 'vertices') else 0)
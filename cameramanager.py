@@ -44,14 +44,34 @@ class CameraManager:
 		"""
 		self.scene.camera = self.main_camera
 
+	def poses(self, n):
+		"""
+		Function that draws the rotations of n camera views at once.
+		:param n: number of views, int
+		:return: rotations, np.ndarray (n, 3) of Euler angles in radians
+		"""
+		poses = np.zeros((n, 3))
+		poses[:, 0] = np.radians(np.random.randint(40, 100, size=n) +
+		                         np.random.random(n))
+		poses[:, 2] = np.radians(np.random.randint(0, 360, size=n) +
+		                         np.random.random(n))
+		return poses
+
+	def set(self, pose):
+		"""
+		Function that changes the camera to the secondary one and sets its
+		rotation.
+		:param pose: rotation of the camera, iterable of 3 Euler angles in radians
+		:return:
+		"""
+		self.scene.camera = self.camera
+		self.camera.rotation_euler[0] = pose[0]
+		self.camera.rotation_euler[2] = pose[2]
+
 	def _make(self):
 		"""
 		Function that changes the camera to the secondary one and sets its position.
 		:return:
 		"""
-		self.scene.camera = self.camera
-		self.camera.rotation_euler[0] = np.radians(np.random.randint(40, 100) +
-		                                           np.random.random())
-		self.camera.rotation_euler[2] = np.radians(np.random.randint(0, 360) +
-		                                           np.random.random())
+		self.set(self.poses(1)[0])
 		print([np.degrees(x) for x in self.camera.rotation_euler])
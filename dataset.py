@@ -1,10 +1,13 @@
+import argparse
 import bpy, bmesh
 from datetime import datetime
 from math import ceil, radians
 import numpy as np
 import os
 import random
+import re
 import sys
+import textwrap
 from time import time
 
 file_dir = os.path.dirname(__file__)
@@ -14,12 +17,18 @@ from annotation import Annotation
 from blender_utils import extrude, gancio, get_min_max
 from cameramanager import CameraManager
 from dataset_config import *
+from exporter import Exporter
 from generator import BuildingFactory
+from launcher import parse_indices
 from light import LightManager
 from material import MaterialFactory
 from module import *
 from point_cloud import PointCloud
+from profiler import Profiler
+from records import read_records, sample_index
 from renderer import Renderer
+from shards import ShardWriter, remove_temporary
+from spec import BuildingSpec, SpecFactory
 from shp2obj import Collection, deselect_all
 
 
@@ -27,67 +36,233 @@ class Dataset:
 	"""
 	Class that manages and creates the dataset.
 	"""
-	def __init__(self):
+	def __init__(self, name=None, seed=SEED, resume=RESUME):
 		"""
 		Class initialization.
+		:param name: name of the annotation file without extension, str, default
+		None - dated name, or the latest dataset when resuming
+		:param seed: seed of the run, every sample is seeded from it and its
+		index, int, default SEED, None - random
+		:param resume: whether to create only the samples that are not complete
+		yet, bool, default RESUME
 		"""
 		self.name = 'Building_dataset_{}_{}_{}'.format(datetime.now().year,
 		                                               datetime.now().month,
 		                                               datetime.now().day)
+		self.resume = resume
+		if name:
+			self.name = name
+		elif self.resume:
+			self.name = self._latest() or self.name
 		self.size = SIZE
-		self.json = Annotation()
+		self.seed = seed
+		if self.seed is None:
+			self.seed = random.SystemRandom().randrange(2 ** 31)
+		print('Seed: {}'.format(self.seed))
+		self.json = Annotation(self.name + '.jsonl' if ANNOTATION_STREAM else None)
+		if self.resume and not ANNOTATION_STREAM:
+			self.json.full = self._records()
 		self.factory = BuildingFactory()
+		self.spec_factory = SpecFactory()
+		self.exporter = Exporter() if EXPORTER == 'numpy' else None
+		self.shards = None
+		if SHARDS:
+			if self.resume:
+				# shards left open by the interrupted run, created again
+				remove_temporary(SHARD_SAVE, self.name + '-')
+			self.shards = ShardWriter(self.name)
+		self.specs = []
+		if SPECS and SPECS != 'random':
+			with open(SPECS) as f:
+				self.specs = [x for x in f if x.strip()]
 		self.material_factory = MaterialFactory()
+		self.profiler = Profiler(self.name + '_profile.jsonl' if PROFILE else '')
 
-	def populate(self):
+	def populate(self, indices=None):
 		"""
 		Function that creates the dataset samples.
+		:param indices: indices of the samples to create, iterable of int,
+		default None - from 0 to the dataset size
 		:return:
 		"""
 		s = time()
-		renderer = Renderer(mode=0)
+		if indices is None:
+			indices = range(self.size)
+		if self.resume:
+			indices = self.missing(indices)
+			print('Resuming {}: {} samples to create'.format(self.name, len(indices)))
+		if SPECS and SPECS != 'random':
+			assert max(indices, default=-1) < len(self.specs), \
+				"{} has {} specs, samples up to {} were requested".format(
+					SPECS, len(self.specs), max(indices))
+		p = self.profiler
+		renderer = Renderer(mode=0, profiler=p)
 		lightmanager = LightManager()
 		cameramanager = CameraManager()
-		for i in range(self.size):
-			lightmanager.make()
-			building = self.factory.produce()
-			building.make()
+		for i in indices:
+			p.start(i)
+			self._seed(i)
+			with p.stage('lights'):
+				lightmanager.make()
+			with p.stage('building'):
+				spec = self._spec(i)
+				if spec is None:
+					building = self.factory.produce()
+				else:
+					building = self.factory.realise(spec)
+				building.make()
 			if use_materials:
+				with p.stage('materials'):
+					_monomaterial = np.random.random() < MATERIAL_PROB
+					mat = self.material_factory.produce()
+				for v in building.volumes:
+					with p.stage('materials'):
+						if not _monomaterial:
+							mat = self.material_factory.produce()
+						v.apply(mat)
+					with p.stage('modules'):
+						v.add_modules()
+
+			with p.stage('annotation'):
+				record = self.json.add(building, '{}.png'.format(i),
+				                       '{}.obj'.format(i), commit=False)
+			cameramanager.make_main()
+			renderer.render(filename='building_{}'.format(i), building=building)
+			if RENDER_VIEWS > 1:
+				renderer.render_views(['building_{}_{}'.format(i, view) for view in
+				                       range(1, RENDER_VIEWS)],
+				                      cameramanager.poses(RENDER_VIEWS - 1),
+				                      building=building, camera=cameramanager.camera,
+				                      on_view=lambda k: self._vary(building,
+				                                                   lightmanager))
+			arrays = None
+			if self.exporter or CLOUD_SAMPLER == 'numpy':
+				with p.stage('mesh_arrays'):
+					arrays = building.get_arrays()
+			with p.stage('export'):
+				if self.exporter:
+					self.exporter.export(i, arrays)
+				else:
+					building.save(i)
+			if CLOUD_SAMPLER == 'numpy':
+				with p.stage('point_cloud'):
+					PointCloud().make(i, arrays)
+			else:
+				with p.stage('save_ply'):
+					building.save(i, ext='ply')
+			if BLEND_SAVE:
+				with p.stage('save_blend'):
+					building.save(i, ext='blend')
+			with p.stage('demolish'):
+				building.demolish()
+			if CLOUD_SAMPLER != 'numpy':
+				with p.stage('point_cloud'):
+					cloud = PointCloud()
+					cloud.make(i)
+			# the sample counts as done for the launcher and --resume once it is
+			# annotated, so the record is added after its outputs are written
+			with p.stage('annotation'):
+				renderer.wait()
+				if self.exporter:
+					self.exporter.wait()
+				self.json.commit(record)
+			if self.shards:
+				with p.stage('shard'):
+					self.shards.write('{:06d}'.format(i), self.members(i), record)
+			p.end()
+
+		renderer.wait()
+		if self.exporter:
+			self.exporter.close()
+		if self.shards:
+			self.shards.close()
+		print(p.summary())
+		print('Whole process took: {}'.format(time() - s))
+
+	def _vary(self, building, lightmanager):
+		"""
+		Function that changes the lights and, if RANDOMIZE_TEXTURES, the
+		materials of the building between two views.
+		:param building: building, ComposedBuilding
+		:param lightmanager: lights of the scene, LightManager
+		:return:
+		"""
+		lightmanager.make()
+		if RANDOMIZE_TEXTURES and use_materials:
+			with self.profiler.stage('materials'):
 				_monomaterial = np.random.random() < MATERIAL_PROB
 				mat = self.material_factory.produce()
 				for v in building.volumes:
 					if not _monomaterial:
 						mat = self.material_factory.produce()
 					v.apply(mat)
-					v.add_modules()
 
-			self.json.add(building, '{}.png'.format(i), '{}.obj'.format(i))
-			cameramanager.make_main()
-			renderer.render(filename='building_{}'.format(i))
-			if RENDER_VIEWS > 1:
-				for view in range(1, RENDER_VIEWS):
-					cameramanager.make()
-					lightmanager.make()
-					if RANDOMIZE_TEXTURES:
-						if use_materials:
-							_monomaterial = np.random.random() < MATERIAL_PROB
-							mat = self.material_factory.produce()
-							for v in building.volumes:
-								if not _monomaterial:
-									mat = self.material_factory.produce()
-								v.apply(mat)
-
-					renderer.render(filename='building_{}_{}'.format(i, view))
-			building.save(i)
-			building.save(i, ext='ply')
-			if BLEND_SAVE:
-				building.save(i, ext='blend')
-			building.demolish()
-			cloud = PointCloud()
-			cloud.make(i)
+	def files(self, i):
+		"""
+		Function that returns the files written for a sample.
+		:param i: index of the sample, int
+		:return: paths, list of str
+		"""
+		return list(self.members(i).values())
 
+	def members(self, i):
+		"""
+		Function that returns the files written for a sample by the extension
+		of their shard member: png, mask.png, ... for the first view, view1.png,
+		view1.mask.png, ... for the others, model.obj (and model.mtl), cloud.ply,
+		blend.
+		:param i: index of the sample, int
+		:return: paths by extension, dict
+		"""
+		members = {}
+		for view in range(RENDER_VIEWS):
+			name = 'building_{}'.format(i)
+			prefix = ''
+			if view:
+				name = 'building_{}_{}'.format(i, view)
+				prefix = 'view{}.'.format(view)
+			members[prefix + 'png'] = '{}/{}.png'.format(IMG_SAVE, name)
+			members[prefix + 'mask.png'] = '{}/{}_mask.png'.format(MASK_SAVE, name)
+			members[prefix + 'depth.png'] = '{}/{}_depth.png'.format(DEPTH_SAVE, name)
+			members[prefix + 'normals.png'] = '{}/{}_normals.png'.format(
+				NORMALS_SAVE, name)
+			if RENDER_EXR:
+				members[prefix + 'depth.exr'] = '{}/{}_depth.exr'.format(DEPTH_SAVE,
+				                                                         name)
+		if self.exporter:
+			models = self.exporter.files(i)
+		else:
+			models = ['{}/{}/{}.{}'.format(os.path.dirname(__file__) or '.',
+			                               MODEL_SAVE, i, x) for x in ['obj', 'mtl']]
+		for path in models:
+			members['model' + os.path.splitext(path)[1]] = path
+		for path in PointCloud().files(i):
+			# i.ply -> cloud.ply, i_2048.ply -> cloud.2048.ply
+			name, ext = os.path.splitext(os.path.basename(path))
+			density = name[len(str(i)) + 1:]
+			members['cloud{}{}'.format('.' + density if density else '', ext)] = path
+		if BLEND_SAVE:
+			members['blend'] = '{}/{}.blend'.format(BLEND_SAVE, i)
+		return members
 
-		print('Whole process took: {}'.format(time() - s))
+	def missing(self, indices=None):
+		"""
+		Function that returns the samples that are not complete: the samples
+		without an annotation or with a missing output file, or with SHARDS the
+		samples that are not packed in a complete shard.
+		:param indices: indices of the samples to check, iterable of int,
+		default None - from 0 to the dataset size
+		:return: indices, list of int
+		"""
+		if indices is None:
+			indices = range(self.size)
+		annotated = {sample_index(x) for x in self._records() + self.json.read()}
+		if self.shards:
+			packed = self.shards.keys()
+			return [i for i in indices if i not in annotated or
+			        '{:06d}'.format(i) not in packed]
+		return [i for i in indices if i not in annotated or
+		        not all(os.path.isfile(x) for x in self.files(i))]
 
 	def write(self):
 		"""
@@ -96,10 +271,96 @@ class Dataset:
 		"""
 		self.json.write(self.name + '.json')
 
+	def _spec(self, i):
+		"""
+		Function that returns the spec of a sample, see SPECS.
+		:param i: index of the sample, int
+		:return: building spec, BuildingSpec or None - no spec
+		"""
+		if not SPECS:
+			return None
+		if SPECS == 'random':
+			return self.spec_factory.produce()
+		return BuildingSpec.from_json(self.specs[i])
+
+	def _seed(self, i):
+		"""
+		Function that seeds the random generators for a sample from the seed of
+		the run and the sample index, so that the sample does not depend on the
+		samples created before it.
+		:param i: index of the sample, int
+		:return:
+		"""
+		state = np.random.SeedSequence([self.seed, i]).generate_state(2)
+		np.random.seed(int(state[0]))
+		random.seed(int(state[1]))
+
+	def _latest(self):
+		"""
+		Function that finds the most recently written dataset annotation, without
+		the profile logs and the fragments of launcher.py workers.
+		:return: name of the annotation file without extension, str or None
+		"""
+		pattern = re.compile(r'Building_dataset_\d+_\d+_\d+\.jsonl?$')
+		files = [x for x in os.listdir() if pattern.match(x)]
+		if not files:
+			return None
+		return os.path.splitext(max(files, key=os.path.getmtime))[0]
+
+	def _records(self):
+		"""
+		Function that reads the compacted annotation of the dataset, if any.
+		:return: annotations, list of dict
+		"""
+		if not os.path.isfile(self.name + '.json'):
+			return []
+		try:
+			return read_records(self.name + '.json')
+		except ValueError:
+			print('Could not read {}.json'.format(self.name))
+			return []
+
 
 if __name__ == '__main__':
-	d = Dataset()
-	d.populate()
+	indices = None
+	name = None
+	seed = SEED
+	resume = RESUME
+	_quit = False
+	if '--' in sys.argv:
+		argv = sys.argv[sys.argv.index('--') + 1:]
+		parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+			USAGE: blender setup.blend --python dataset.py -- --indices 0-99
+
+			------------------------------------------------------------------------
+
+			This is a worker that creates a part of the dataset, see launcher.py.
+
+			------------------------------------------------------------------------
+
+			'''))
+		parser.add_argument('--indices', type=str, default=None,
+		                    help='sample indices to create, e.g. 0-9,15,20-29')
+		parser.add_argument('--name', type=str, default=None,
+		                    help='name of the annotation file to write')
+		parser.add_argument('--seed', type=int, default=SEED,
+		                    help='seed of the run')
+		parser.add_argument('--resume', action='store_true', default=RESUME,
+		                    help='create only the samples that are not complete')
+		parser.add_argument('--quit', action='store_true',
+		                    help='close Blender when the samples are done')
+		args = parser.parse_args(argv)
+		if args.indices:
+			indices = parse_indices(args.indices)
+		name = args.name
+		seed = args.seed
+		resume = args.resume
+		_quit = args.quit
+
+	d = Dataset(name=name, seed=seed, resume=resume)
+	d.populate(indices)
 	d.write()
+	if _quit:
+		bpy.ops.wm.quit_blender()
 
 
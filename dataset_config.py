@@ -1,3 +1,5 @@
+import os as _os
+
 MIN_HEIGHT = 3.0
 MIN_WIDTH = 6.0
 MIN_LENGTH = 6.0
@@ -18,8 +20,23 @@ use_materials = True  # apply materials to the facades of the buildings, bool
 
 MATERIAL_PROB = 0.7  # Probability of all the volumes of one building to be of the same material
 
+TEXTURE_CACHE = 32  # maximum number of texture images kept loaded (images of materials on the scene stay), 0 - no limit
+
 use_modules = True
 
+PURGE_SCENE = True  # remove the building collections and unused data-blocks after every sample
+
+MESH_BUILDER = 'numpy'  # 'numpy' - build the boxes of volumes and modules from arrays, 'bpy' - with operators
+
+INSTANCE_MODULES = True  # place modules as linked duplicates instead of operator copies
+
+SPECS = None  # None - compose the buildings in Blender, 'random' - draw a building spec per sample (spec.py),
+# path of a .jsonl file of specs written by spec.py - realise spec i for sample i
+
+OVERLAP_CHECK = 'box'  # 'box' - bounding box tests with BVH only for other shapes, 'bvh' - BVH for all
+IOU_CHECK = 'box'  # 'box' - closed-form intersections of bounding boxes, 'boolean' - boolean modifiers
+INDEX_CELL = 4.0  # cell size in meters of the spatial index used to find overlapping modules
+
 MODULES = {'window': {'rule': 'grid',
                       'materials': ['glass']},  # variant: material
            'balcony': {'rule': 'column',
@@ -34,8 +51,47 @@ MODULES = {'window': {'rule': 'grid',
 POINTS = 2048  # points to be samples from the mesh to get a point cloud
 # 2048 in ModelNET
 
+CLOUD_SAMPLER = 'numpy'  # 'numpy' - sample the Blender meshes in memory, 'pyntcloud' - resample an exported .ply
+CLOUD_FORMAT = 'ply'  # 'ply' or 'npz', format of the point clouds of the 'numpy' sampler
+CLOUD_DENSITIES = [POINTS]  # clouds sampled by the 'numpy' sampler, e.g. [2048, 8192, 32768] -> i_2048.ply, i_8192.ply, ...
+CLOUD_LABELS = True  # store the semantic (inst_id) and instance (object) id of every point
+
+ANNOTATION_STREAM = True  # append every sample to name.jsonl as soon as it is made, compacted to name.json at the end
+RESUME = False  # create only the samples that are missing from the dataset (files or annotation)
+ANNOTATION_SYNC = 10  # number of samples after which the .jsonl file is synced to disk
+
+EXPORTER = 'bpy'  # 'bpy' - export operators (.obj with .mtl, UVs and normals), 'numpy' - write the triangles
+# of the building from its mesh data on a background thread (exporter.py), without materials, UVs and normals
+EXPORT_FORMATS = ['obj']  # formats of the EXPORTER = 'numpy' models in MODEL_SAVE, 'obj', 'ply', 'npz'
+EXPORT_THREADED = True  # write the models on a background thread
+
+SHARDS = False  # pack every sample (images, annotations, model, point cloud, record) into .tar shards (shards.py)
+SHARD_SIZE = 2 ** 30  # maximum size of a shard in bytes
+SHARD_KEEP_FILES = False  # keep the packed files in their folders, otherwise removed once their shard is complete
+
 RENDER_EXR = False  # change for True if you want an .exr depth map
 
+RENDER_PROFILE = 'standard'  # render quality of the images, a key of RENDER_PROFILES, None - keep the setup.blend settings
+RENDER_PROFILES = {'draft': {'samples': 16, 'adaptive_threshold': 0.1, 'denoise': True,
+                             'max_bounces': 2, 'tile': 2048},
+                   'standard': {'samples': 128, 'adaptive_threshold': 0.05, 'denoise': True,
+                                'max_bounces': 4, 'tile': 2048},
+                   'final': {'samples': 512, 'adaptive_threshold': 0.01, 'denoise': True,
+                             'max_bounces': 12, 'tile': 2048}}
+ANNOTATION_ENGINE = None  # engine of the mask, depth and normals renders: None - ENGINE,
+# 'BLENDER_EEVEE' ('BLENDER_EEVEE_NEXT' in Blender 4.2+) - rasterised at ANNOTATION_SAMPLES, the image stays with ENGINE
+ANNOTATION_SAMPLES = 1  # samples of the annotation renders (SINGLE_PASS = False or ANNOTATION_ENGINE set)
+
+SINGLE_PASS = True  # write masks, depth and normals with File Output nodes during the image render
+
+IMAGE_WRITERS = 2  # threads encoding the mask, depth and normals .png files when SINGLE_PASS = False, 0 - save_render;
+# not used with SINGLE_PASS = True (the default): the File Output nodes write the passes during the render
+IMAGE_WRITER_STANDARD = False  # encode the passes with the Standard view transform whatever the scene uses, otherwise
+# the writer only runs for scenes with the Standard view transform and the other passes are saved with save_render
+IMAGE_WRITER_CHECK = False  # compare the first pass of every kind written by the image writer with save_render
+
+HEADLESS = False  # frame the camera without VIEW_3D operators, always on with blender --background
+
 RANDOMIZE_TEXTURES = False  # randomization of textures per every additional view
 
 RENDER_VIEWS = 3
@@ -48,8 +104,15 @@ CLOUD_SAVE = 'PointCloud'
 DEPTH_SAVE = 'Depth'
 MODULE_PATH = 'Modules'
 NORMALS_SAVE = 'Normals'
+SHARD_SAVE = 'Shards'
 BLEND_SAVE = ''  # leave an empty string in case you don't need the .blend files
 
 ENGINE = 'CYCLES'
 
-SCRIPT_PATH = open('setup.txt').read()[:-1]
\ No newline at end of file
+PROFILE = True  # write per-sample stage timings to <dataset name>_profile.jsonl
+
+WORKERS = 4  # number of Blender processes started by launcher.py
+BLENDER = 'blender'  # Blender executable used by launcher.py
+SEED = None  # seed of the run, sample i is seeded from (SEED, i); None for a random seed, printed at start
+
+SCRIPT_PATH = open(_os.path.join(_os.path.dirname(_os.path.abspath(__file__)), 'setup.txt')).read()[:-1]
\ No newline at end of file
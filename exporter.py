@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+import sys
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import EXPORT_FORMATS, EXPORT_THREADED, MODEL_SAVE
+
+
+def write_obj(filename, arrays):
+	"""
+	Function that writes the triangles of a building as an .obj file, one
+	object per mesh, in the Y up coordinates of the Blender .obj exporter.
+	:param filename: path of the file, str
+	:param arrays: triangles of the building from blender_utils.mesh_arrays,
+	dict
+	:return:
+	"""
+	vertices = arrays['vertices']
+	vertices = np.stack([vertices[:, 0], vertices[:, 2], -vertices[:, 1]], axis=1)
+	objects = arrays['objects']
+	with open(filename, 'w') as f:
+		f.write('# Building\n')
+		np.savetxt(f, vertices, fmt='v %.6f %.6f %.6f')
+		starts = np.searchsorted(objects, np.arange(len(arrays['names']) + 1))
+		for k, name in enumerate(arrays['names']):
+			f.write('o {}\n'.format(name))
+			np.savetxt(f, arrays['triangles'][starts[k]:starts[k + 1]] + 1,
+			           fmt='f %d %d %d')
+
+
+def write_ply(filename, arrays):
+	"""
+	Function that writes the triangles of a building as a binary .ply file.
+	:param filename: path of the file, str
+	:param arrays: triangles of the building from blender_utils.mesh_arrays,
+	dict
+	:return:
+	"""
+	faces = np.empty(len(arrays['triangles']),
+	                 dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+	faces['n'] = 3
+	faces['v'] = arrays['triangles']
+	header = ['ply', 'format binary_little_endian 1.0',
+	          'element vertex {}'.format(len(arrays['vertices'])),
+	          'property float x', 'property float y', 'property float z',
+	          'element face {}'.format(len(faces)),
+	          'property list uchar int vertex_indices', 'end_header']
+	with open(filename, 'wb') as f:
+		f.write(('\n'.join(header) + '\n').encode('ascii'))
+		arrays['vertices'].astype('<f4').tofile(f)
+		faces.tofile(f)
+
+
+def write_npz(filename, arrays):
+	"""
+	Function that writes the triangles of a building as a compressed .npz
+	file with the object and semantic id of every triangle.
+	:param filename: path of the file, str
+	:param arrays: triangles of the building from blender_utils.mesh_arrays,
+	dict
+	:return:
+	"""
+	with open(filename, 'wb') as f:
+		np.savez_compressed(f, vertices=arrays['vertices'],
+		                    triangles=arrays['triangles'],
+		                    objects=arrays['objects'], ids=arrays['ids'],
+		                    names=np.array(arrays['names']))
+
+
+class Exporter:
+	"""
+	Class that writes the geometry of the buildings from their mesh data, on
+	a background thread if needed, so that the next sample does not wait for
+	the files.
+	"""
+	def __init__(self, formats=EXPORT_FORMATS, threaded=EXPORT_THREADED):
+		"""
+		Class initialization.
+		:param formats: formats to write, list of str, 'obj', 'ply' or 'npz'
+		:param threaded: whether to write on a background thread, bool
+		"""
+		self.writers = {'obj': write_obj, 'ply': write_ply, 'npz': write_npz}
+		assert all(x in self.writers for x in formats), \
+			"Expected formats in {}, got {}".format(list(self.writers), formats)
+		self.formats = formats
+		self.directory = '{}/{}'.format(file_dir or '.', MODEL_SAVE)
+		os.makedirs(self.directory, exist_ok=True)
+		self.pool = ThreadPoolExecutor(max_workers=1) if threaded else None
+		self.futures = []
+
+	def export(self, filename, arrays):
+		"""
+		Function that writes a building in every format.
+		:param filename: name of the files without extension, str or int
+		:param arrays: triangles of the building from blender_utils.mesh_arrays,
+		dict, not to be changed afterwards
+		:return:
+		"""
+		if self.pool is None:
+			self._write(filename, arrays)
+			return
+		self.futures = [x for x in self.futures if not x.done() or x.exception()]
+		self.futures.append(self.pool.submit(self._write, filename, arrays))
+
+	def files(self, filename):
+		"""
+		Function that returns the files written for a building.
+		:param filename: name of the files without extension, str or int
+		:return: paths, list of str
+		"""
+		return ['{}/{}.{}'.format(self.directory, filename, x) for x in self.formats]
+
+	def wait(self):
+		"""
+		Function that waits for the pending files, raising the first error.
+		:return:
+		"""
+		futures, self.futures = self.futures, []
+		for future in futures:
+			future.result()
+
+	def close(self):
+		"""
+		Function that waits for the pending files and stops the thread.
+		:return:
+		"""
+		self.wait()
+		if self.pool is not None:
+			self.pool.shutdown()
+			self.pool = None
+
+	def _write(self, filename, arrays):
+		"""
+		Function that writes a building in every format. Every file is written
+		under a temporary name first, so that an interrupted run leaves no
+		truncated files.
+		:param filename: name of the files without extension, str or int
+		:param arrays: triangles of the building, dict
+		:return:
+		"""
+		for x in self.formats:
+			path = '{}/{}.{}'.format(self.directory, filename, x)
+			self.writers[x](path + '.tmp', arrays)
+			os.replace(path + '.tmp', path)
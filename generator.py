@@ -9,17 +9,23 @@ import sys
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
-from blender_utils import extrude, gancio, get_min_max
+from blender_utils import extrude, gancio, get_min_max, mesh_arrays, purge
+from bounds import invalidate
 from dataset_config import *
 from material import Material
 from module import *
+from overlap_control import SpatialIndex
 from point_cloud import PointCloud
 from renderer import Renderer
 from shp2obj import Collection, deselect_all
+from spec import link_c, link_l, link_patio, side_location
 from volume import *
 
 sys.path.append(SCRIPT_PATH)
-from pyntcloud import PyntCloud
+try:
+	from pyntcloud import PyntCloud
+except ImportError:
+	PyntCloud = None  # only needed by the 'pyntcloud' sampler
 
 
 class BuildingFactory:
@@ -53,6 +59,40 @@ class BuildingFactory:
 		_volumes = CollectionFactory().produce(number=self.mapping[name][1]).collection
 		return self.mapping[name][0](_volumes)
 
+	def realise(self, spec):
+		"""
+		Function that produces the building described by a spec.
+		:param spec: building spec, BuildingSpec
+		:return: building, SpecBuilding
+		"""
+		volumes = []
+		for s in spec.volumes:
+			v = Volume(scale=(s.width, s.length, s.height))
+			v.width, v.length, v.height, v.floor = s.width, s.length, s.height, \
+			                                       s.floor
+			v.spec = s
+			volumes.append(v)
+		return SpecBuilding(volumes, spec)
+
+
+def _rotate(volume):
+	volume.mesh.rotation_euler[2] = radians(90)
+
+
+def _place_along(volume, volumes):
+	"""
+	Function that places volumes outside one side of a volume, at random
+	locations along it, see spec.side_location.
+	:param volume: volume to place along, Volume
+	:param volumes: volumes to place, list of Volume
+	:return:
+	"""
+	coords = [get_min_max(volume.mesh, 0), get_min_max(volume.mesh, 1)]
+	along = 0 if random.random() < 0.5 else 1
+	for _volume in volumes:
+		_volume.mesh.location[0], _volume.mesh.location[1] = side_location(
+			coords, _volume.length, _volume.width, along)
+
 
 class ComposedBuilding:
 	"""
@@ -62,9 +102,15 @@ class ComposedBuilding:
 		assert isinstance(volumes, list), "Expected volumes as list," \
 		                                  " got {}".format(type(volumes))
 		self.volumes = volumes
+		self.index = SpatialIndex(self.volumes)
+		for v in self.volumes:
+			v.index = self.index
 		self._nest()
 
 	def demolish(self):
+		if PURGE_SCENE:
+			purge('Building')
+			return
 		for _mesh in bpy.data.collections['Building'].objects:
 			try:
 				deselect_all()
@@ -72,6 +118,14 @@ class ComposedBuilding:
 				bpy.ops.object.delete()
 			except Exception:
 				pass
+		invalidate()
+
+	def get_arrays(self):
+		"""
+		Function that reads the triangles of the building and its modules.
+		:return: arrays, dict, see blender_utils.mesh_arrays
+		"""
+		return mesh_arrays(bpy.data.collections['Building'].all_objects)
 
 	def get_bb(self):
 		"""
@@ -91,6 +145,25 @@ class ComposedBuilding:
 		return [round(x_min, 3), round(y_min, 3), round(x_max, 3),
 		        round(y_max, 3)]
 
+	def get_bb_3d(self):
+		"""
+		Function that gets the 3D bounding box of the Building and its modules in
+		blender coordinate space.
+		:return: bounding box, list of float
+		[x_min, y_min, z_min, x_max, y_max, z_max]
+		"""
+		_meshes = [x for x in bpy.data.collections['Building'].all_objects
+		           if x.type == 'MESH']
+		if not _meshes:
+			_meshes = [v.mesh for v in self.volumes]
+		_bb = [float('inf')] * 3 + [-float('inf')] * 3
+		for _mesh in _meshes:
+			for axis in range(3):
+				_min, _max = get_min_max(_mesh, axis)
+				_bb[axis] = min(_bb[axis], _min)
+				_bb[axis + 3] = max(_bb[axis + 3], _max)
+		return _bb
+
 	def make(self):
 		"""
 		Function that composes the building based on its typology.
@@ -143,6 +216,23 @@ class ComposedBuilding:
 			bpy.data.collections.new('Building')
 
 
+class SpecBuilding(ComposedBuilding):
+	"""
+	Class that represents a building realised from a BuildingSpec: the
+	volumes are placed as described by the spec.
+	"""
+	def __init__(self, volumes, spec):
+		ComposedBuilding.__init__(self, volumes)
+		self.spec = spec
+
+	def make(self):
+		for v, s in zip(self.volumes, self.spec.volumes):
+			v.create()
+			v.mesh.rotation_euler[2] = radians(s.rotation)
+			v.mesh.location[0], v.mesh.location[1] = s.location
+		return self.volumes
+
+
 class LBuilding(ComposedBuilding):
 	"""
 	Class that represents an L-shaped building.
@@ -153,7 +243,7 @@ class LBuilding(ComposedBuilding):
 	def make(self):
 		# add rotation if len > width (or vice versa)
 		self._correct_volumes()
-		gancio(self.volumes[0], self.volumes[1], 0, 0, 0) # TODO: Rename or make a separate private function
+		link_l(self.volumes, gancio)
 		return self.volumes
 
 	def _correct_volumes(self):
@@ -180,12 +270,7 @@ class CBuilding(LBuilding):
 
 	def make(self):
 		self._correct_volumes()
-		for v in self.volumes[1:]:
-			if v.width < v.length:
-				v.mesh.rotation_euler[2] = radians(90)
-
-		gancio(self.volumes[0], self.volumes[1], 0, 1, 0)
-		gancio(self.volumes[0], self.volumes[2], 0, 0, 0)
+		link_c(self.volumes, gancio, _rotate)
 		return self.volumes
 
 
@@ -203,29 +288,7 @@ class Patio(ComposedBuilding):
 	def make(self):
 
 		self._correct_volumes()
-		if np.random.random() < 0.5:
-			# circular linkage between buildings
-			for i, _v in enumerate(self.volumes[:-1]):
-				if i % 2 == 0:
-					self.volumes[i + 1].mesh.rotation_euler[2] = radians(90)
-				if i == 0:
-					gancio(_v, self.volumes[i + 1], 0, 1, 1)
-				elif i == 1:
-					gancio(_v, self.volumes[i + 1], 1, 1, 0)
-				elif i == 2:
-					gancio(_v, self.volumes[i + 1], 0, 0, 0)
-		else:
-			# cap linkage between buildings
-			for i, _v in enumerate(self.volumes[:-1]):
-				if i % 2 == 0:
-					self.volumes[i + 1].mesh.rotation_euler[2] = radians(90)
-				if i == 0:
-					gancio(_v, self.volumes[i + 1], 1, 1, 0)
-				elif i == 1:
-					gancio(_v, self.volumes[i + 1], 1, 1, 0)
-				elif i == 2:
-					gancio(_v, self.volumes[i + 1], 1, 0, 1)
-
+		link_patio(self.volumes, gancio, _rotate)
 		return self.volumes
 
 	def _correct_volumes(self):
@@ -276,6 +339,7 @@ class ClosedPatio(Patio):
 
 		for v in self.volumes[:2]:
 			v1 = Factory().produce(scale=(v.width, v.length, v.height))
+			v1.index = self.index
 			self.volumes.append(v1)
 
 
@@ -291,20 +355,7 @@ class TBuilding(ComposedBuilding):
 
 	def make(self):
 		self._correct_volumes()
-		x_min, x_max = get_min_max(self.volumes[0].mesh, 0)  # width
-		y_min, y_max = get_min_max(self.volumes[0].mesh, 1)  # length
-
-		if random.random() < 0.5:
-			self.volumes[1].mesh.location[0] = random.choice(np.linspace(int(x_min + (self.volumes[1].length)),
-				      int(x_max - (self.volumes[1].length)), 10))
-			self.volumes[1].mesh.location[1] = y_min - self.volumes[1].width
-
-		else:
-			self.volumes[1].mesh.location[1] = random.choice(np.linspace(
-				int(y_min + (self.volumes[1].width)),
-				int(y_max - (self.volumes[1].width)), 10))
-			self.volumes[1].mesh.location[0] = x_min - self.volumes[1].length
-
+		_place_along(self.volumes[0], self.volumes[1:2])
 		return self.volumes
 
 
@@ -336,22 +387,7 @@ class EBuilding(ComposedBuilding):
 	def make(self):
 
 		self._correct_volumes()
-		x_min, x_max = get_min_max(self.volumes[0].mesh, 0)  # width
-		y_min, y_max = get_min_max(self.volumes[0].mesh, 1)  # length
-
-		if random.random() < 0.5:
-			for _volume in self.volumes[1:]:
-				_volume.mesh.location[0] = random.choice(np.linspace(int(x_min + (_volume.length)),
-					      int(x_max - (_volume.length)), 10))
-				_volume.mesh.location[1] = y_min - _volume.width
-
-		else:
-			for _volume in self.volumes[1:]:
-				_volume.mesh.location[1] = random.choice(np.linspace(
-					int(y_min + (_volume.width)),
-					int(y_max - (_volume.width)), 10))
-				_volume.mesh.location[0] = x_min - _volume.length
-
+		_place_along(self.volumes[0], self.volumes[1:])
 		return self.volumes
 
 
@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+import struct
+import sys
+import zlib
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import IMAGE_WRITERS
+
+
+def to_srgb(pixels):
+	"""
+	Function that converts linear color values to 8 bit sRGB, as the Standard
+	view transform does when an image is saved.
+	:param pixels: linear values, np.ndarray of floats
+	:return: sRGB values, np.ndarray of uint8
+	"""
+	pixels = np.clip(pixels, 0.0, 1.0)
+	pixels = np.where(pixels <= 0.0031308, pixels * 12.92,
+	                  1.055 * np.power(pixels, 1 / 2.4) - 0.055)
+	return np.round(pixels * 255).astype(np.uint8)
+
+
+def write_png(filename, pixels, level=6, premultiplied=True):
+	"""
+	Function that writes an RGBA image in Blender pixel order (bottom row
+	first, linear values) as an 8 bit .png file.
+	:param filename: path of the file, str
+	:param pixels: pixels of the image, np.ndarray (height, width, 4) of floats
+	:param level: zlib compression level, int, default 6
+	:param premultiplied: whether the colors are multiplied by alpha, as in the
+	float images of Blender, bool, default True. A .png file stores straight
+	alpha, so the colors are divided by alpha as save_render does
+	:return:
+	"""
+	height, width = pixels.shape[:2]
+	colors = pixels[::-1, :, :3]
+	alpha = pixels[::-1, :, 3:]
+	if premultiplied:
+		colors = np.divide(colors, alpha, out=np.array(colors, dtype=np.float32),
+		                   where=alpha > 0)
+	image = np.empty((height, width, 4), dtype=np.uint8)
+	image[..., :3] = to_srgb(colors)
+	image[..., 3] = np.round(np.clip(alpha[..., 0], 0.0, 1.0) * 255)
+	# every row starts with the filter type, 0 - none
+	rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+	rows[:, 1:] = image.reshape(height, -1)
+
+	def chunk(kind, data):
+		return struct.pack('>I', len(data)) + kind + data + \
+		       struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+	with open(filename, 'wb') as f:
+		f.write(b'\x89PNG\r\n\x1a\n')
+		f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0,
+		                                   0, 0)))
+		f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), level)))
+		f.write(chunk(b'IEND', b''))
+
+
+class ImageWriter:
+	"""
+	Class that encodes and writes rendered images on a pool of threads, so that
+	the next render does not wait for the compression of the previous images.
+	"""
+	def __init__(self, workers=IMAGE_WRITERS):
+		"""
+		Class initialization.
+		:param workers: number of threads, int, 0 - write on the calling thread
+		"""
+		self.pool = ThreadPoolExecutor(max_workers=workers) if workers else None
+		# images kept in memory before the writer waits for the oldest one
+		self.limit = 2 * workers
+		self.futures = []
+
+	def write(self, filename, pixels):
+		"""
+		Function that writes an image as a .png file.
+		:param filename: path of the file, str
+		:param pixels: pixels of the image, np.ndarray (height, width, 4) of
+		floats, not to be changed afterwards
+		:return:
+		"""
+		if self.pool is None:
+			self._write(filename, pixels)
+			return
+		self.futures = [x for x in self.futures if not x.done() or x.exception()]
+		while len(self.futures) >= self.limit:
+			self.futures.pop(0).result()
+		self.futures.append(self.pool.submit(self._write, filename, pixels))
+
+	def wait(self):
+		"""
+		Function that waits for the pending images, raising the first error.
+		:return:
+		"""
+		futures, self.futures = self.futures, []
+		for future in futures:
+			future.result()
+
+	def close(self):
+		"""
+		Function that waits for the pending images and stops the threads.
+		:return:
+		"""
+		self.wait()
+		if self.pool is not None:
+			self.pool.shutdown()
+			self.pool = None
+
+	def _write(self, filename, pixels):
+		"""
+		Function that writes an image under a temporary name first, so that an
+		interrupted run leaves no truncated files.
+		:param filename: path of the file, str
+		:param pixels: pixels of the image, np.ndarray (height, width, 4)
+		:return:
+		"""
+		write_png(filename + '.tmp', pixels)
+		os.replace(filename + '.tmp', filename)
@@ -11,6 +11,37 @@ import sys
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
+from bounds import get_bounds, invalidate, is_box
+
+
+def box_intersection(bounds, others):
+	"""
+	Function that calculates in closed form the volumes of intersection of an
+	axis-aligned box with several others.
+	:param bounds: bounding box, np.ndarray (2, 3)
+	:param others: bounding boxes, np.ndarray (N, 2, 3)
+	:return: volumes of intersection, np.ndarray (N,)
+	"""
+	others = np.asarray(others).reshape(-1, 2, 3)
+	sides = np.minimum(others[:, 1], bounds[1]) - np.maximum(others[:, 0], bounds[0])
+	return np.prod(np.clip(sides, 0, None), axis=1)
+
+
+def box_iou(bounds, others):
+	"""
+	Function that calculates in closed form the intersection over union of an
+	axis-aligned box with several others.
+	:param bounds: bounding box, np.ndarray (2, 3)
+	:param others: bounding boxes, np.ndarray (N, 2, 3)
+	:return: intersections over union, np.ndarray (N,)
+	"""
+	others = np.asarray(others).reshape(-1, 2, 3)
+	_intersection = box_intersection(bounds, others)
+	_union = np.prod(bounds[1] - bounds[0]) + \
+	         np.prod(others[:, 1] - others[:, 0], axis=1) - _intersection
+	return _intersection / _union
+
+
 def get_min_max(volume, axis):
 	"""
 	Function that returns limits of a mesh on the indicated axis. Only applied
@@ -19,12 +50,8 @@ def get_min_max(volume, axis):
 	:param axis: int, 0 - width; 1 - length; 2 - height
 	:return: min, max, float
 	"""
-	bpy.context.view_layer.update()
-	bb_vertices = [Vector(v) for v in volume.bound_box]
-	mat = volume.matrix_world
-	world_bb_vertices = [mat @ v for v in bb_vertices]
-	return min([x[axis: axis + 1][0] for x in world_bb_vertices]), \
-		   max([x[axis: axis + 1][0] for x in world_bb_vertices])
+	bounds = get_bounds(volume)
+	return float(bounds[0, axis]), float(bounds[1, axis])
 
 
 class IoU:
@@ -66,6 +93,7 @@ class IoU:
 		_volume.mesh.modifiers['Boolean'].object = volume2.mesh
 		bpy.ops.object.modifier_apply(modifier='Boolean')
 		result = self._get(_volume.mesh)
+		invalidate(_volume.mesh)
 		select(_volume.mesh)
 		bpy.ops.object.delete()
 		return result
@@ -143,6 +171,54 @@ class Intersection(IoU):
 		return self._intersection(self.v1, self.v2)
 
 
+class BoxIoU(IoU):
+	"""
+	Class that calculates the intersection over union of two objects in closed
+	form when both are boxes rotated by multiples of 90 degrees, and with
+	boolean modifiers otherwise.
+	"""
+	def __init__(self, v1, v2):
+		"""
+		Class initialization.
+		:param v1: first volume, Volume or Module
+		:param v2: second volume, Volume or Module
+		"""
+		IoU.__init__(self, v1, v2)
+		self.name = 'box_iou'
+
+	def _boxes(self, v1, v2):
+		return is_box(v1.mesh) and is_box(v2.mesh)
+
+	def _intersection(self, v1, v2):
+		if self._boxes(v1, v2):
+			return float(box_intersection(get_bounds(v1.mesh),
+			                              get_bounds(v2.mesh))[0])
+		return IoU._intersection(self, v1, v2)
+
+	def _iou(self, v1, v2):
+		if self._boxes(v1, v2):
+			return float(box_iou(get_bounds(v1.mesh), get_bounds(v2.mesh))[0])
+		return IoU._iou(self, v1, v2)
+
+
+class BoxIntersection(BoxIoU):
+	"""
+	Class that calculates the intersection of two objects in closed form when
+	both are boxes, and with a boolean modifier otherwise.
+	"""
+	def __init__(self, v1, v2):
+		"""
+		Class initialization.
+		:param v1: first volume, Volume or Module
+		:param v2: second volume, Volume or Module
+		"""
+		BoxIoU.__init__(self, v1, v2)
+		self.name = 'box_intersection'
+
+	def _calculate(self) -> float:
+		return self._intersection(self.v1, self.v2)
+
+
 class IoU2D(IoU):
 	"""
 	Class that calculates the intersection over union of two 3D objects.
@@ -160,6 +236,8 @@ class IoU2D(IoU):
 		_volume1 = self._curve_to_mesh(self.v1)
 		_volume2 = self._curve_to_mesh(self.v2)
 		iou = self._iou(_volume1, _volume2)
+		invalidate(_volume1)
+		invalidate(_volume2)
 		_volume1.select_set(True)
 		_volume2.select_set(True)
 		bpy.ops.object.delete()
@@ -0,0 +1,212 @@
+import argparse
+from datetime import datetime
+import glob
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import textwrap
+
+file_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(file_dir)
+
+from dataset_config import BLENDER, CLOUD_SAVE, DEPTH_SAVE, IMG_SAVE, \
+	MASK_SAVE, MODEL_SAVE, NORMALS_SAVE, SEED, SHARD_SAVE, SIZE, WORKERS
+from records import read_records, sample_index
+from shards import remove_temporary
+
+
+def parse_indices(value):
+	"""
+	Function that parses a string of sample indices.
+	:param value: indices, str, e.g. '0-9,15,20-29'
+	:return: indices, list of int
+	"""
+	indices = []
+	for part in value.split(','):
+		if not part:
+			continue
+		if '-' in part:
+			start, stop = part.split('-')
+			indices += list(range(int(start), int(stop) + 1))
+		else:
+			indices.append(int(part))
+	return indices
+
+
+def format_indices(indices):
+	"""
+	Function that writes sample indices as a compact string of ranges.
+	:param indices: indices, iterable of int
+	:return: indices, str, e.g. '0-9,15,20-29'
+	"""
+	parts = []
+	for i in sorted(set(indices)):
+		if parts and parts[-1][1] == i - 1:
+			parts[-1][1] = i
+		else:
+			parts.append([i, i])
+	return ','.join(['{}-{}'.format(x, y) if x != y else str(x) for x, y in parts])
+
+
+class Launcher:
+	"""
+	Class that creates the dataset with several Blender processes, each one
+	creating a disjoint set of samples.
+	"""
+	def __init__(self, workers=WORKERS, size=SIZE, seed=SEED, name=None,
+	             background=False, retries=2):
+		"""
+		Class initialization.
+		:param workers: number of Blender processes, int
+		:param size: dataset size, int
+		:param seed: seed of the run, shared by the workers, int, default SEED,
+		None - random
+		:param name: name of the annotation file without extension, str,
+		default None - dated name
+		:param background: whether to run Blender in background mode, bool
+		:param retries: number of times the missing samples are restarted, int
+		"""
+		self.workers = max(1, workers)
+		self.size = size
+		self.seed = seed
+		if self.seed is None:
+			self.seed = random.SystemRandom().randrange(2 ** 31)
+		self.name = name
+		if not self.name:
+			self.name = 'Building_dataset_{}_{}_{}'.format(datetime.now().year,
+			                                               datetime.now().month,
+			                                               datetime.now().day)
+		print('Seed: {}'.format(self.seed))
+		self.background = background
+		self.retries = retries
+
+	def run(self):
+		"""
+		Function that starts the workers, restarts the samples of the workers
+		that failed and merges the annotations.
+		:return: indices of the samples that could not be created, list of int
+		"""
+		for folder in [IMG_SAVE, MASK_SAVE, DEPTH_SAVE, NORMALS_SAVE, CLOUD_SAVE,
+		               MODEL_SAVE]:
+			os.makedirs('{}/{}'.format(file_dir, folder), exist_ok=True)
+		missing = self._missing()
+		attempt = 0
+		while missing and attempt <= self.retries:
+			# no worker is running: the open shards of crashed workers are removed
+			remove_temporary('{}/{}'.format(file_dir, SHARD_SAVE), self.name + '_part')
+			processes = [self._start(shard, k, attempt) for k, shard in
+			             enumerate(self._split(missing))]
+			for k, process in enumerate(processes):
+				if process.wait() != 0:
+					print('Worker {} exited with code {}'.format(k, process.returncode))
+			missing = self._missing()
+			attempt += 1
+		self._merge()
+		if missing:
+			print('Samples {} were not created'.format(format_indices(missing)))
+		return missing
+
+	def _fragments(self):
+		"""
+		Function that lists the annotation files written by the workers, both
+		the compacted .json and the streamed .jsonl ones, without their profile
+		logs.
+		:return: paths, list of str
+		"""
+		pattern = re.compile(re.escape(self.name) + r'_part\d+_\d+\.jsonl?$')
+		return sorted(x for x in glob.glob('{}/{}_part*'.format(file_dir, self.name))
+		              if pattern.match(os.path.basename(x)))
+
+	def _merge(self):
+		"""
+		Function that merges the worker annotations into one annotation file.
+		:return:
+		"""
+		records = self._records()
+		with open('{}/{}.json'.format(file_dir, self.name), 'w') as f:
+			json.dump([records[x] for x in sorted(records)], f)
+		for fragment in self._fragments():
+			os.remove(fragment)
+		print('Annotation successfully written as {}.json'.format(self.name))
+
+	def _missing(self):
+		"""
+		Function that returns the samples that have no annotation yet.
+		:return: indices, list of int
+		"""
+		return sorted(set(range(self.size)) - set(self._records()))
+
+	def _records(self):
+		"""
+		Function that reads the worker annotations and the merged annotation of
+		a previous run with the same name.
+		:return: annotations by sample index, dict
+		"""
+		records = {}
+		merged = '{}/{}.json'.format(file_dir, self.name)  # of a previous run
+		for fragment in ([merged] if os.path.isfile(merged) else []) + \
+		                self._fragments():
+			try:
+				for record in read_records(fragment):
+					records[sample_index(record)] = record
+			except (ValueError, KeyError):
+				print('Could not read {}'.format(fragment))
+		return records
+
+	def _split(self, indices):
+		"""
+		Function that splits the indices into contiguous shards, one per worker.
+		:param indices: indices to split, list of int
+		:return: shards, list of list of int
+		"""
+		n = min(self.workers, len(indices))
+		step = len(indices) / n
+		return [indices[round(k * step):round((k + 1) * step)] for k in range(n)]
+
+	def _start(self, shard, k, attempt):
+		"""
+		Function that starts a Blender process that creates one shard.
+		:param shard: indices of the samples, list of int
+		:param k: number of the worker, int
+		:param attempt: number of the attempt, int
+		:return: process, subprocess.Popen
+		"""
+		command = [BLENDER, 'setup.blend']
+		if self.background:
+			command.append('--background')
+		command += ['--python-exit-code', '1', '--python', 'dataset.py', '--',
+		            '--indices', format_indices(shard), '--seed', str(self.seed),
+		            '--name', '{}_part{}_{}'.format(self.name, attempt, k), '--quit']
+		print('Worker {}: samples {}'.format(k, format_indices(shard)))
+		return subprocess.Popen(command, cwd=file_dir)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: python launcher.py --workers 8
+
+		------------------------------------------------------------------------
+
+		This is a launcher that creates the dataset with several Blender
+		processes and merges their annotations.
+
+		------------------------------------------------------------------------
+
+		'''), formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--workers', type=int, default=WORKERS,
+	                    help='number of Blender processes')
+	parser.add_argument('--size', type=int, default=SIZE, help='dataset size')
+	parser.add_argument('--seed', type=int, default=SEED, help='seed of the run')
+	parser.add_argument('--name', type=str, default=None,
+	                    help='name of the annotation file')
+	parser.add_argument('--background', action='store_true',
+	                    help='run Blender in background mode')
+	parser.add_argument('--retries', type=int, default=2,
+	                    help='number of times the missing samples are restarted')
+	args = parser.parse_args()
+
+	Launcher(args.workers, args.size, args.seed, args.name, args.background,
+	         args.retries).run()
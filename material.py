@@ -1,16 +1,188 @@
 import bpy
+from collections import OrderedDict
 import numpy as np
 import os
 import sys
+import zlib
 
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 file_dir = file_dir.replace('\\', '/').replace('\r', '/r').replace('\n', '/n').\
 	replace('\t', '/t')
 
+from dataset_config import TEXTURE_CACHE
+
 # TODO: check mtl import option
 
 
+class ImageCache:
+	"""
+	Process-wide cache of the texture images, so that every texture file is
+	decoded once. Above the cache size the least recently used images of the
+	materials that no object uses are released.
+	"""
+	def __init__(self, size=TEXTURE_CACHE):
+		"""
+		Class initialization.
+		:param size: maximum number of images to keep loaded, int, 0 - no limit
+		"""
+		self.size = size
+		self.images = OrderedDict()  # (material name, map type): image
+
+	def get(self, name, map_type, path):
+		"""
+		Function that returns the image of a texture map, loading it if needed.
+		:param name: name of the material, str
+		:param map_type: type of the map, str
+		:param path: path of the image file, str
+		:return: texture map, bpy image object
+		"""
+		key = (name, map_type)
+		image = self.images.get(key)
+		if image is not None:
+			try:
+				_ = image.name  # the image may have been removed from bpy.data
+				self.images.move_to_end(key)
+				return image
+			except ReferenceError:
+				del self.images[key]
+		image = bpy.data.images.load(path, check_existing=True)
+		image.use_fake_user = True  # kept when the scene is purged
+		self.images[key] = image
+		self._evict(name)
+		return image
+
+	def _evict(self, keep=None):
+		"""
+		Function that releases the least recently used images above the cache
+		size. An image is removed from its texture nodes and from bpy.data, the
+		material loads it again when it is produced next time. Images of
+		materials used by an object stay loaded.
+		:param keep: name of the material whose images are kept, e.g. the one
+		being loaded, str, default None
+		:return:
+		"""
+		for key in list(self.images):
+			if not self.size or len(self.images) <= self.size:
+				return
+			if key[0] == keep:
+				continue
+			try:
+				if self._release(self.images[key]):
+					del self.images[key]
+			except ReferenceError:
+				del self.images[key]
+
+	def _release(self, image):
+		"""
+		Function that removes an image from the texture nodes of the materials
+		and from bpy.data.
+		:param image: image to release, bpy image object
+		:return: whether the image was released, bool
+		"""
+		nodes = []
+		for material in bpy.data.materials:
+			if material.node_tree is None:
+				continue
+			_nodes = [x for x in material.node_tree.nodes
+			          if getattr(x, 'image', None) == image]
+			if not _nodes:
+				continue
+			if material.users > int(material.use_fake_user):
+				return False  # used by an object of the scene
+			nodes += _nodes
+		for node in nodes:
+			node.image = None
+		image.use_fake_user = False
+		if image.users == 0:
+			bpy.data.images.remove(image)
+		return True
+
+
+image_cache = ImageCache()
+
+
+class MaterialLibrary:
+	"""
+	Class that scans the Textures folder once and hands out the texture
+	materials from an in-memory registry. The materials of material.blend are
+	appended with one library load, the template material is copied for every
+	texture material.
+	"""
+	def __init__(self, filename='material'):
+		"""
+		Class initialization.
+		:param filename: name of the .blend file in Textures and of its template
+		material, str, default 'material'
+		"""
+		self.filename = filename
+		self.path = file_dir + '/Textures/{}.blend'.format(self.filename)
+		self.names = sorted([x for x in os.listdir('{}/Textures'.format(file_dir))
+		                     if os.path.isdir('{}/Textures/{}'.format(file_dir, x))])
+		self.materials = {}  # name: bpy material
+		self.template = None
+
+	def get(self, name):
+		"""
+		Function that returns the material with the given name, creating it from
+		the template if needed.
+		:param name: name of the material, str
+		:return: material, bpy material
+		"""
+		material = self.materials.get(name)
+		if self._valid(material):
+			return material
+		material = bpy.data.materials.get(name)
+		if not self._valid(material):
+			material = self._load().copy()
+			material.name = name
+		material.use_fake_user = True  # kept when the scene is purged
+		self.materials[name] = material
+		return material
+
+	def _load(self):
+		"""
+		Function that appends the materials of the .blend file in one library
+		load and returns the template material.
+		:return: template material, bpy material
+		"""
+		if self._valid(self.template, check_nodes=False):
+			return self.template
+		with bpy.data.libraries.load(self.path, link=False) as (data_from, data_to):
+			data_to.materials = list(data_from.materials)
+		for material in data_to.materials:
+			material.use_fake_user = True
+			if material.name.split('.')[0] == self.filename:
+				self.template = material
+			elif material.name in self.names:
+				self.materials[material.name] = material
+		assert self.template is not None, "No {} material in {}".format(
+			self.filename, self.path)
+		return self.template
+
+	def _valid(self, material, check_nodes=True):
+		"""
+		Function that checks that a material still exists and has the texture
+		nodes of the template.
+		:param material: material to check, bpy material or None
+		:param check_nodes: whether to check the texture nodes, bool, default True
+		:return: result, bool
+		"""
+		if material is None:
+			return False
+		try:
+			_ = material.name  # raises if the material was removed from bpy.data
+			if not check_nodes:
+				return True
+			return material.node_tree is not None and \
+			       'Diffuse_texture' in material.node_tree.nodes
+		except ReferenceError:
+			return False
+
+
+library = MaterialLibrary()
+
+
 class Material:
 	"""
 	Class that represents a material object in Blender.
@@ -18,16 +190,11 @@ class Material:
 	def __init__(self, name):
 		self.name = name.lower().capitalize()  # name of the material and its texture folder
 		self.filename = 'material'
-		self._path = file_dir + '/Textures/{}.blend'.format(self.filename)
-		self._add = '\\Material\\'
 		self.value = self._load()  # loads material into the scene
 		self._update_nodes()  # loads the textures to the material
 
 	def _load(self):
-		try:
-			return bpy.data.materials[self.name]  #.copy()
-		except KeyError:
-			return self._load_new()
+		return library.get(self.name)
 
 	def _load_maps(self, map_type):
 		"""
@@ -42,28 +209,19 @@ class Material:
 			"Unknown map type, expected one of: 'Diffuse', 'Normal'," \
 			"'Roughness', 'Displacement'"
 		try:
-			bpy.ops.image.open(filepath=file_dir + '/Textures/{}/{}.png'.
-			                   format(self.name, map_type.capitalize()))
-			_images = [x.filepath for x in bpy.data.images]
-			return bpy.data.images[_images.index('//Textures'
-			                                     '\\{}\\{}.png'.format(self.name,
-			                                                               map_type))]
+			return image_cache.get(self.name, map_type,
+			                       file_dir + '/Textures/{}/{}.png'.
+			                       format(self.name, map_type.capitalize()))
 		except Exception as e:
 			print('Failed to load {} texture of {}'.format(map_type, self.name))
 			print(repr(e))
 
 	def _load_new(self):
 		try:
-			# print(file_dir)
-			bpy.ops.wm.append(filepath=self._path + self._add + self.filename,
-				filename='{}'.format(self.filename),
-				directory=self._path + self._add)
-			materials = [x for x in bpy.data.materials if x.name.startswith('material')]
-			materials[-1].name = self.name
-			return bpy.data.materials[self.name]
+			return library.get(self.name)
 		except Exception as e:
 			print(repr(e))
-			print('Could not import {} from {}'.format(self.name, self._path))
+			print('Could not import {} from {}'.format(self.name, library.path))
 			raise KeyboardInterrupt()
 
 	def _update_nodes(self):
@@ -104,6 +262,7 @@ class GlassMaterial(Material):
 			bpy.ops.material.new()
 			_material = [x for x in bpy.data.materials if 'Material' in x.name][-1]
 			_material.name = self.name
+			_material.use_fake_user = True
 			return _material
 
 	def _update_nodes(self):
@@ -125,13 +284,17 @@ class MetallMaterial(Material):
 			bpy.ops.material.new()
 			_material = [x for x in bpy.data.materials if 'Material' in x.name][-1]
 			_material.name = self.name
+			_material.use_fake_user = True
 			return _material
 
 	def _update_nodes(self):
 		if 'Principled BSDF' not in [x.name for x in self.value.node_tree.nodes]:
 			self.value.node_tree.nodes.new('ShaderNodeBsdfPrincipled')
 			node1 = self.value.node_tree.nodes['Principled BSDF']
-			_gray = np.random.uniform(0.2, 0.4)
+			# own generator: the material is made once per process, drawing from
+			# the sample generators would shift the sample that happens to make it
+			_gray = np.random.RandomState(zlib.crc32(self.name.encode())).\
+				uniform(0.2, 0.4)
 			node1.inputs[0].default_value = [_gray, _gray, _gray, 1.0]
 			node1.inputs[4] = 1.0
 
@@ -144,8 +307,7 @@ class MaterialFactory:
 	Class that produces materials based on the given name.
 	"""
 	def __init__(self):
-		self.materials = os.listdir('{}/Textures'.format(file_dir))
-		self.materials = [x for x in self.materials if os.path.isdir('{}/Textures/{}'.format(file_dir, x))]
+		self.materials = library.names
 
 	def produce(self, name=None, color=None):
 		if name:
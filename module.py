@@ -1,6 +1,6 @@
 import bpy, bmesh
 from contextlib import redirect_stdout, redirect_stderr
-from copy import copy
+from copy import copy, deepcopy
 import io
 import math
 import numpy as np
@@ -16,6 +16,7 @@ from dataset_config import *
 from blender_utils import *
 from material import MaterialFactory
 from overlap_control import OverlapVolumeController, OverlapOtherVolumeController
+from spec import applier_positions
 from shp2obj import Collection, deselect_all
 
 
@@ -83,6 +84,34 @@ class Module:
 			m.connect(self.connector.axis, self.connector.side)
 		return m
 
+	def instance(self, position=(0, 0, 0)):
+		"""
+		Function that makes a linked duplicate of the module moved by a given
+		offset. Unlike copy it calls no operators: the duplicate shares the mesh
+		data of the module, the volume and the collection of the module but no
+		mutable attributes, e.g. its scale.
+		:param position: offset from the module location, iterable of 3 numbers
+		:return: duplicate, Module
+		"""
+		mesh = bpy.data.objects.new(self.mesh.name, self.mesh.data)
+		mesh.location = [x + y for x, y in zip(self.mesh.location, position)]
+		mesh.rotation_euler = self.mesh.rotation_euler
+		mesh.scale = self.mesh.scale
+		mesh.pass_index = self.mesh.pass_index
+		mesh["inst_id"] = self.mesh["inst_id"]
+		for collection in self.mesh.users_collection:
+			collection.objects.link(mesh)
+		m = self.__class__.__new__(self.__class__)
+		m.__dict__.update(self.__dict__)
+		for key, value in self.__dict__.items():
+			if isinstance(value, (list, dict, np.ndarray)):
+				setattr(m, key, deepcopy(value))
+		if self.connector is not None:
+			m.connector = copy(self.connector)
+			m.connector.module = m
+		m.mesh = mesh
+		return m
+
 	def apply(self):
 		if len(MODULES[self.name]['materials']) > 0:
 			_material = np.random.choice(MODULES[self.name]['materials'])
@@ -110,8 +139,12 @@ class Module:
 			self.mesh.location[i] += position[i]
 
 	def remove(self):
+		index = getattr(self.volume, 'index', None)
+		if index is not None:
+			index.remove(self.mesh)
 		deselect_all()
 		bpy.data.objects[self.mesh.name].select_set(True)
+		invalidate(self.mesh)
 		with redirect_stdout(stdout), redirect_stderr(stdout):
 			bpy.ops.object.delete()
 
@@ -119,6 +152,24 @@ class Module:
 		self.mesh["inst_id"] = IdAssigner().make(self.name)
 		self.mesh.pass_index = IdAssigner().make(self.name)
 
+	def _box(self, triangulate=True):
+		"""
+		Function that creates a unit cube scaled to the module scale.
+		:param triangulate: whether the faces of the NumPy built cube are split
+		into triangles, bool, default True
+		:return: cube, blender object
+		"""
+		if MESH_BUILDER == 'numpy':
+			deselect_all()
+			mesh = box_mesh(self.name, (1.0, 1.0, 1.0), triangulate=triangulate)
+			mesh.scale = self.scale
+			select(mesh)
+			return mesh
+		bpy.ops.mesh.primitive_cube_add(size=1.0)
+		bpy.ops.transform.resize(value=self.scale)
+		bpy.context.selected_objects[0].name = self.name
+		return bpy.context.selected_objects[0]
+
 	def _connect(self, axis, side):
 		self.connector = self.ModuleConnector(self, axis, side)
 
@@ -167,7 +218,7 @@ class Module:
 
 	def _triangulate(self):
 		deselect_all()
-		if self.mesh:
+		if self.mesh and not triangulated(self.mesh):
 			select(self.mesh)
 			bpy.ops.object.modifier_add(type='TRIANGULATE')
 			bpy.ops.object.modifier_apply()
@@ -185,10 +236,7 @@ class Window(Module):
 		self.y_offset = 1.0
 
 	def _create(self):
-		bpy.ops.mesh.primitive_cube_add(size=1.0)
-		bpy.ops.transform.resize(value=self.scale)
-		bpy.context.selected_objects[0].name = self.name
-		return bpy.context.selected_objects[0]
+		return self._box()
 
 	class ModuleConnector(Connector):
 		def __init__(self, module: Module, axis: bool, side):
@@ -231,12 +279,20 @@ class ParametricWindow(Window):
 		bpy.ops.object.editmode_toggle()
 
 	def _create(self):
-		bpy.ops.mesh.primitive_cube_add(size=1.0)
-		bpy.context.selected_objects[0].name = self.name
-		self.mesh = bpy.context.selected_objects[0]
-		select(self.mesh)
-		bpy.ops.object.editmode_toggle()
-		bpy.ops.transform.resize(value=self.scale)
+		if MESH_BUILDER == 'numpy':
+			deselect_all()
+			self.mesh = box_mesh(self.name, self.scale, triangulate=False)
+			select(self.mesh)
+			bpy.ops.object.editmode_toggle()
+		else:
+			bpy.ops.mesh.primitive_cube_add(size=1.0)
+			bpy.context.selected_objects[0].name = self.name
+			self.mesh = bpy.context.selected_objects[0]
+			select(self.mesh)
+			bpy.ops.object.editmode_toggle()
+			_mesh = bmesh.from_edit_mesh(self.mesh.data)
+			bmesh.ops.scale(_mesh, vec=self.scale, verts=_mesh.verts[:])
+			bmesh.update_edit_mesh(self.mesh.data)
 
 		if self.h_bars > 0:
 			self._cut()
@@ -253,35 +309,29 @@ class ParametricWindow(Window):
 		return self.mesh
 
 	def _cut(self, axis=1):
-		# axis = 0 horizontal loops
-		# axis = 4 vertical loops
+		"""
+		Function that adds evenly spaced loop cuts to the window with bmesh, so
+		that no VIEW_3D area is needed.
+		:param axis: direction of the loops, 1 - horizontal loops,
+		4 - vertical loops, default 1
+		:return:
+		"""
 		if axis == 1:
 			_bars = self.h_bars
+			_edge_axis = 2  # horizontal loops cut the vertical edges
 		else:
-			axis = 4
 			_bars = self.v_bars
-		_dict = self._setup()
-		bpy.ops.mesh.loopcut_slide(_dict,
-		                           MESH_OT_loopcut={"number_cuts": _bars,
-		                                            "smoothness": 0,
-		                                            "falloff": 'INVERSE_SQUARE',
-		                                            "object_index": 0,
-		                                            # Was 'INVERSE_SQUARE' that does not exist
-		                                            "edge_index": axis,
-		                                            "mesh_select_mode_init": (
-		                                            True, False, False)},
-		                           TRANSFORM_OT_edge_slide={"value": 0,
-		                                                    "mirror": False,
-		                                                    "snap": False,
-		                                                    "snap_target": 'CLOSEST',
-		                                                    "snap_point": (
-		                                                    0, 0, 0),
-		                                                    "snap_align": False,
-		                                                    "snap_normal": (
-		                                                    0, 0, 0),
-		                                                    "correct_uv": False,
-		                                                    "release_confirm": False,
-		                                                    "use_accurate": False})
+			_edge_axis = 0
+		_mesh = bmesh.from_edit_mesh(self.mesh.data)
+		edges = []
+		for e in _mesh.edges:
+			_direction = e.verts[1].co - e.verts[0].co
+			if _direction.length > 0 and \
+					abs(_direction[_edge_axis]) > 0.99 * _direction.length:
+				edges.append(e)
+		bmesh.ops.subdivide_edges(_mesh, edges=edges, cuts=_bars,
+		                          use_grid_fill=True)
+		bmesh.update_edit_mesh(self.mesh.data)
 
 	def _extrude(self, _mesh):
 		self._select_faces(_mesh)
@@ -313,17 +363,6 @@ class ParametricWindow(Window):
 		for f in faces[:max(1, self.h_bars + 1) * max(1, self.v_bars + 1) * 2]:
 			f.select = True
 
-	def _setup(self):
-		area = [x for x in bpy.context.window.screen.areas if x.type == 'VIEW_3D'][0]
-		space = area.spaces[0]
-		region = [x for x in area.regions if x.type =='WINDOW'][0]
-		return {'scene':  bpy.context.scene,
-		        'region' : region,
-		        'area'   : area,
-		        'space'  : space}
-
-
-
 
 class Balcony(Module):
 	def __init__(self, name: str='balcony', scale: tuple=(1.0, 1.0, 1.0), mesh=None,
@@ -401,10 +440,7 @@ class Roof(Module):
 			self.scale[1] = np.diff(get_min_max(self.volume.mesh, 1))[0] * (
 						1 + np.random.uniform(0, 0.2))
 		deselect_all()
-		bpy.ops.mesh.primitive_cube_add(size=1.0)
-		bpy.ops.transform.resize(value=self.scale)
-		bpy.context.selected_objects[0].name = self.name
-		return bpy.context.selected_objects[0]
+		return self._box()
 
 	class ModuleConnector(Connector):
 		def __init__(self, module: Module, axis: bool, side):
@@ -429,10 +465,7 @@ class SlopedRoof(Roof):
 			self.scale[1] = np.diff(get_min_max(self.volume.mesh, 1))[0] * (
 						1 + np.random.uniform(0, 0.2))
 		deselect_all()
-		bpy.ops.mesh.primitive_cube_add(size=1.0)
-		bpy.ops.transform.resize(value=self.scale)
-		bpy.context.selected_objects[0].name = self.name
-		_name = bpy.context.selected_objects[0].name
+		_name = self._box(triangulate=False).name  # the roof is cut from the quads
 
 		mesh = bmesh.new()
 		mesh.from_mesh(bpy.data.objects[_name].data)
@@ -456,6 +489,8 @@ class SlopedRoof(Roof):
 			v.co[2] += uplift
 
 		mesh.to_mesh(bpy.data.objects[_name].data)
+		invalidate(bpy.data.objects[_name])
+		bpy.data.objects[_name]["box"] = 0  # checked with BVH for overlaps
 		return bpy.data.objects[_name]
 
 
@@ -469,10 +504,7 @@ class Door(Module):
 		self.y_offset = 1.0
 
 	def _create(self):
-		bpy.ops.mesh.primitive_cube_add(size=1.0)
-		bpy.ops.transform.resize(value=self.scale)
-		bpy.context.selected_objects[0].name = self.name
-		return bpy.context.selected_objects[0]
+		return self._box()
 
 	class ModuleConnector(Connector):
 		def __init__(self, module: Module, axis: bool, side):
@@ -510,6 +542,19 @@ class ModuleFactory:
 		else:
 			return self.mapping['generic']
 
+	def produce_kind(self, kind: str) -> object:
+		"""
+		Function that returns a module class based on its class name, e.g. the
+		kind of a ModuleSpec.
+		:param kind: name of the module class, str
+		:return: module class, Module
+		"""
+		for y in self.mapping.values():
+			for module_type in (y if isinstance(y, list) else [y]):
+				if module_type.__name__ == kind:
+					return module_type
+		return self.mapping['generic']
+
 
 class ApplierFactory:
 	"""
@@ -558,6 +603,69 @@ class ModuleApplier:
 				self.volume_controller.make(m)
 			except Exception:
 				pass
+		self._index(module)
+
+	def _index(self, module):
+		"""
+		Function that adds a placed module to the spatial index of its building.
+		:param module: placed module, Module
+		:return:
+		"""
+		index = getattr(module.volume, 'index', None)
+		if index is not None:
+			index.insert(module.mesh, module.volume.name, module.name)
+
+	def _place(self, module, positions):
+		"""
+		Function that places duplicates of the module at the given offsets and
+		removes the overlapping modules.
+		:param module: module to duplicate, Module
+		:param positions: offsets from the module location, np.ndarray (N, 3)
+		:return:
+		"""
+		for position in positions:
+			if INSTANCE_MODULES:
+				m = module.instance(position)
+			else:
+				m = copy(module)
+				m.position(position)
+			self._index(m)
+			self.controller.make(m)
+			try:
+				self.volume_controller.make(m)
+			except Exception:
+				pass
+
+	def _positions(self, module, offset, step, grid):
+		"""
+		Function that computes the offsets of the copies of a connected module
+		with the rule of the applier.
+		:param module: connected module, Module
+		:param offset: offset from the borders of the volume, tuple
+		(left, bottom, right, top)
+		:param step: parameter of the grid, tuple (hor_step, vert_step) or None
+		:param grid: parameters of the grid, tuple (rows, cols) or None
+		:return: offsets, np.ndarray (N, 3)
+		"""
+		axis = module.connector.axis
+		_min, _max = get_min_max(module.volume.mesh, abs(1 - axis))
+		return applier_positions(self.name, axis, module.scale, module.y_offset,
+		                         _max - _min, module.volume.height, offset, step,
+		                         grid)
+
+	def realise(self, module, positions):
+		"""
+		Function that places copies of a connected module at precomputed
+		offsets, e.g. from a ModuleSpec.
+		:param module: connected module, Module
+		:param positions: offsets from the module location, np.ndarray (N, 3)
+		:return:
+		"""
+		if self.name == 'single':
+			self._index(module)
+			return
+		self._place(module, positions)
+		module.remove()
 
 
 class GridApplier(ModuleApplier):
@@ -603,37 +711,7 @@ class GridApplier(ModuleApplier):
 		                         "{}".format(len(offset))
 		assert module.connector is not None, "Module should be connected to a volume"
 
-		axis = module.connector.axis
-		_start1 = int(offset[0] + module.scale[abs(1-axis)] / 2)
-		_start2 = int(offset[1] + module.y_offset + module.scale[2] / 2)
-		_end1 = int(np.diff(get_min_max(module.volume.mesh, abs(1-axis))) -
-		               (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-		_end2 = int(module.volume.height -
-		           (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-
-		if step:
-			step_x, step_h = step
-		else:
-			step_x, step_h = int((_end1 - _start1) / grid[0]),\
-			                 int((_end2 - _start2) / grid[1])
-			if step_x == 0:
-				step_x = math.ceil((_end1 - _start1) / grid[0])
-			if step_h == 0:
-				step_h = math.ceil((_end2 - _start2) / grid[1])
-
-		for x in range(_start1, _end1, int(step_x)):
-			for h in range(_start2, _end2, int(step_h)):
-				m = copy(module)
-				position = np.array([0, 0, 0])
-				position[abs(1-axis)] = x
-				position[2] = h
-				m.position(position)
-				self.controller.make(m)
-				try:
-					self.volume_controller.make(m)
-				except Exception:
-					pass
-
+		self._place(module, self._positions(module, offset, step, grid))
 		module.remove()
 
 
@@ -681,41 +759,7 @@ class ColumnApplier(ModuleApplier):
 		                         "{}".format(len(offset))
 		assert module.connector is not None, "Module should be connected to a volume"
 
-		axis = module.connector.axis
-		_start1 = int(offset[0] + module.scale[abs(1-axis)] / 2)
-		_start2 = int(offset[1] + module.y_offset + module.scale[2] / 2)
-		_end1 = int(np.diff(get_min_max(module.volume.mesh, abs(1-axis))) -
-		               (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-		_end2 = int(module.volume.height -
-		           (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-
-		if step:
-			step_x, step_h = step
-		else:
-			step_x, step_h = int((_end1 - _start1) / grid[0]),\
-			                 int((_end2 - _start2) / grid[1])
-			if step_x == 0:
-				step_x = math.ceil((_end1 - _start1) / grid[0])
-			if step_h == 0:
-				step_h = math.ceil((_end2 - _start2) / grid[1])
-
-		col_number = np.random.randint(1, max(2, int((_end1 - _start1) / step_x)))
-		columns = list(set(np.random.randint(0, int((_end1 - _start1) / step_x),
-		                        size=col_number)))
-
-		for col in columns:
-			x = int(_start1) + int(step_x) * col
-			for h in range(_start2, _end2, int(step_h)):
-				m = copy(module)
-				position = np.array([0, 0, 0])
-				position[abs(1 - axis)] = x
-				position[2] = h
-				m.position(position)
-				self.controller.make(m)
-				try:
-					self.volume_controller.make(m)
-				except Exception:
-					pass
+		self._place(module, self._positions(module, offset, step, grid))
 		module.remove()
 
 
@@ -763,40 +807,7 @@ class RowApplier(ModuleApplier):
 		                         "{}".format(len(offset))
 		assert module.connector is not None, "Module should be connected to a volume"
 
-		axis = module.connector.axis
-		_start1 = int(offset[0] + module.scale[abs(1-axis)] / 2)
-		_start2 = int(offset[1] + module.y_offset + module.scale[2] / 2)
-		_end1 = int(np.diff(get_min_max(module.volume.mesh, abs(1-axis))) -
-		               (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-		_end2 = int(module.volume.height -
-		           (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-
-		if step:
-			step_x, step_h = step
-		else:
-			step_x, step_h = int((_end1 - _start1) / grid[0]),\
-			                 int((_end2 - _start2) / grid[1])
-			if step_x == 0:
-				step_x = math.ceil((_end1 - _start1) / grid[0])
-			if step_h == 0:
-				step_h = math.ceil((_end2 - _start2) / grid[1])
-
-		row_number = np.random.randint(1, max(2, int((_end1 - _start1) / step_x)))
-		rows = list(set(np.random.randint(0, int((_end2 - _start2)/step_h),
-		                                  size=row_number)))
-		for row in rows:
-			h = int(_start2) + int(step_h) * row
-			for x in range(_start1, _end1, int(step_x)):
-				m = copy(module)
-				position = np.array([0, 0, 0])
-				position[abs(1-axis)] = x
-				position[2] = h
-				m.position(position)
-				self.controller.make(m)
-				try:
-					self.volume_controller.make(m)
-				except Exception:
-					pass
+		self._place(module, self._positions(module, offset, step, grid))
 		module.remove()
 
 
@@ -844,39 +855,7 @@ class RandomGridApplier(ModuleApplier):
 		                         "{}".format(len(offset))
 		assert module.connector is not None, "Module should be connected to a volume"
 
-		axis = module.connector.axis
-		_start1 = int(offset[0] + module.scale[abs(1-axis)] / 2)
-		_start2 = int(offset[1] + module.y_offset + module.scale[2] / 2)
-		_end1 = int(np.diff(get_min_max(module.volume.mesh, abs(1-axis))) -
-		               (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-		_end2 = int(module.volume.height -
-		           (int(offset[2] + module.scale[abs(1-axis)] / 2)))
-
-		if step:
-			step_x, step_h = step
-		else:
-			step_x, step_h = int((_end1 - _start1) / grid[0]),\
-			                 int((_end2 - _start2) / grid[1])
-			if step_x == 0:
-				step_x = math.ceil((_end1 - _start1) / grid[0])
-			if step_h == 0:
-				step_h = math.ceil((_end2 - _start2) / grid[1])
-
-
-		# x = int(_start1) + int(step_x) * (col-1)
-		for x in range(_start1, _end1, int(step_x)):
-			for h in range(_start2, _end2, int(step_h)):
-				if np.random.random() > 0.5:
-					m = copy(module)
-					position = np.array([0, 0, 0])
-					position[abs(1-axis)] = x
-					position[2] = h
-					m.position(position)
-					self.controller.make(m)
-					try:
-						self.volume_controller.make(m)
-					except Exception:
-						pass
+		self._place(module, self._positions(module, offset, step, grid))
 		module.remove()
 
 if __name__ == '__main__':
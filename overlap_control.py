@@ -1,6 +1,8 @@
 import bpy
+import itertools
 import mathutils
 import io
+import numpy as np
 import os
 import sys
 
@@ -8,6 +10,8 @@ file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 stdout = io.StringIO()
 from blender_utils import *
+from bounds import get_bounds, invalidate, is_box, overlap
+from dataset_config import INDEX_CELL, OVERLAP_CHECK
 from iou import Intersection
 
 class OverlapController:
@@ -23,6 +27,15 @@ class OverlapController:
 		"""
 		return self._make(m1, m2)
 
+	def make_many(self, m1, objects):
+		"""
+		Function that checks whether an object overlaps each of the given objects
+		:param m1: object to check the overlap of, mesh
+		:param objects: objects to check the overlap with, list of mesh
+		:return: results, list of bool
+		"""
+		return [bool(self._make(m1, x)) for x in objects]
+
 	def _make(self, m1, m2):
 		"""
 		Function that checks whether two objects overlap
@@ -40,39 +53,209 @@ class OverlapController:
 		if len(_result) > 0:
 			return True
 
+
+class BoxOverlapController(OverlapController):
+	"""
+	Overlap controller that compares world-space bounding boxes of the objects
+	with vectorised interval tests. The BVH check is only used for the objects
+	that are not boxes, e.g. sloped roofs.
+	"""
+	def __init__(self):
+		OverlapController.__init__(self)
+		self.name = 'box'
+
+	def make_many(self, m1, objects):
+		"""
+		Function that checks whether an object overlaps each of the given objects
+		:param m1: object to check the overlap of, mesh
+		:param objects: objects to check the overlap with, list of mesh
+		:return: results, np.ndarray of bool
+		"""
+		if len(objects) == 0:
+			return np.zeros(0, dtype=bool)
+		_locations = np.array([x.location for x in objects])
+		near = np.linalg.norm(_locations - np.array(m1.location), axis=1) < 1.5
+		hits = overlap(get_bounds(m1), np.array([get_bounds(x) for x in objects]))
+		boxes = np.array([is_box(x) for x in objects]) & is_box(m1)
+		result = near | (hits & boxes)
+		# bounding boxes overlap, but the shapes have to be checked exactly
+		for i in np.flatnonzero(hits & ~boxes & ~result):
+			result[i] = len(intersection_check(m1, objects[i])) > 0
+		return result
+
+	def _make(self, m1, m2):
+		"""
+		Function that checks whether two objects overlap
+		:param m1: object to check the overlap of, mesh
+		:param m2: object to check the overlap of, mesh
+		:return: result, bool
+		"""
+		return bool(self.make_many(m1, [m2])[0])
+
+
+def make_controller():
+	"""
+	Function that returns the overlap controller set in the config.
+	:return: controller, OverlapController
+	"""
+	if OVERLAP_CHECK == 'box':
+		return BoxOverlapController()
+	return OverlapController()
+
+
+class SpatialIndex:
+	"""
+	Uniform grid over the bounding boxes of the volumes and modules of one
+	building, used to find the objects a module may overlap without scanning
+	the scene. The grid is two-dimensional (x, y), the exact test is 3D.
+	"""
+	def __init__(self, volumes=None, cell=INDEX_CELL):
+		"""
+		Class initialization.
+		:param volumes: volumes of the building, list of Volume, default None
+		:param cell: size of a grid cell in meters, float, default INDEX_CELL
+		"""
+		self.volumes = volumes if volumes is not None else []
+		self.cell = float(cell)
+		self.entries = {}  # object name: (object, bounds, volume name, kind)
+		self.cells = {}  # (i, j): set of object names
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __repr__(self):
+		return 'SpatialIndex({} objects, {} cells of {} m)'.format(len(self.entries),
+		                                                        len(self.cells),
+		                                                        self.cell)
+
+	def dump(self):
+		"""
+		Function that returns the content of the index for debugging.
+		:return: entries by object name, dict
+		{name: {'volume': str, 'kind': str, 'bounds': list, 'cells': int}}
+		"""
+		return {name: {'volume': volume, 'kind': kind,
+		               'bounds': bounds.round(3).tolist(),
+		               'cells': len(list(self._cells(bounds)))}
+		        for name, (_, bounds, volume, kind) in self.entries.items()}
+
+	def index_volumes(self):
+		"""
+		Function that (re)inserts the volumes of the building.
+		:return:
+		"""
+		for v in self.volumes:
+			if v.mesh is not None:
+				self.insert(v.mesh, v.name, 'volume')
+
+	def insert(self, obj, volume, kind):
+		"""
+		Function that inserts an object into the index or updates its bounds.
+		:param obj: object to insert, blender object
+		:param volume: name of the volume the object belongs to, str
+		:param kind: 'volume' or the module name, str
+		:return:
+		"""
+		self.remove(obj)
+		bounds = get_bounds(obj)
+		self.entries[obj.name] = (obj, bounds, volume, kind)
+		for key in self._cells(bounds):
+			self.cells.setdefault(key, set()).add(obj.name)
+
+	def query(self, bounds, margin=0.0):
+		"""
+		Function that returns the indexed objects whose bounding boxes overlap
+		the given one.
+		:param bounds: bounding box, np.ndarray (2, 3)
+		:param margin: distance to grow the bounding box by, float, default 0.0
+		:return: entries, list of tuple (object, volume name, kind)
+		"""
+		bounds = np.array(bounds) + np.array([[-margin], [margin]])
+		names = set()
+		for key in self._cells(bounds):
+			names |= self.cells.get(key, set())
+		names = sorted(names)
+		if not names:
+			return []
+		hits = overlap(bounds, np.array([self.entries[x][1] for x in names]))
+		return [(self.entries[x][0], self.entries[x][2], self.entries[x][3])
+		        for x, hit in zip(names, hits) if hit]
+
+	def remove(self, obj):
+		"""
+		Function that removes an object from the index. Should be called before
+		the object is deleted.
+		:param obj: object to remove, blender object or its name
+		:return:
+		"""
+		name = obj if isinstance(obj, str) else obj.name
+		entry = self.entries.pop(name, None)
+		if entry is None:
+			return
+		for key in self._cells(entry[1]):
+			self.cells[key].discard(name)
+			if not self.cells[key]:
+				del self.cells[key]
+
+	def _cells(self, bounds):
+		"""
+		Function that lists the grid cells covered by a bounding box.
+		:param bounds: bounding box, np.ndarray (2, 3)
+		:return: cells, iterator of tuple (i, j)
+		"""
+		low = np.floor(bounds[0, :2] / self.cell).astype(int)
+		high = np.floor(bounds[1, :2] / self.cell).astype(int)
+		return itertools.product(range(low[0], high[0] + 1),
+		                         range(low[1], high[1] + 1))
+
+
 class OverlapVolumeController:
 	def __init__(self):
-		self.controller = OverlapController()
+		self.controller = make_controller()
 
 	def make(self, module):
 		return self._make(module)
 
 	def _make(self, module):
-		_children = []
-		for sub in [x.name for x in bpy.data.collections[module.volume.name].children]:
-			if module.name not in sub and sub not in module.name:
-				_children += bpy.data.collections[sub].objects
+		index = getattr(module.volume, 'index', None)
+		if index is not None:
+			_children = [x for x, volume, kind in
+			             index.query(get_bounds(module.mesh), margin=1.5)
+			             if volume == module.volume.name and kind != 'volume' and
+			             module.name not in kind and kind not in module.name]
+		else:
+			_children = []
+			for sub in [x.name for x in bpy.data.collections[module.volume.name].children]:
+				if module.name not in sub and sub not in module.name:
+					_children += bpy.data.collections[sub].objects
 
-		for _child in _children:  # mesh
-			result = self.controller.make(module.mesh, _child)
+		results = self.controller.make_many(module.mesh, _children)
+		for _child, result in zip(_children, results):  # mesh
 			if result:
+				if index is not None:
+					index.remove(_child)
 				deselect_all()
+				invalidate(_child)
 				_child.select_set(True)
 				# with redirect_stdout(stdout), redirect_stderr(stdout):
 				bpy.ops.object.delete()
 
 class OverlapOtherVolumeController:
 	def __init__(self):
-		self.controller = OverlapController()
+		self.controller = make_controller()
 
 	def make(self, module):
 		return self._make(module)
 
 	def _make(self, module):
-		_volumes = [x for x in bpy.data.objects if 'volume' in x.name]
+		index = getattr(module.volume, 'index', None)
+		if index is not None:
+			_volumes = [x for x, volume, kind in
+			            index.query(get_bounds(module.mesh), margin=1.5)
+			            if kind == 'volume' and x.name != module.volume.mesh.name]
+		else:
+			_volumes = [x for x in bpy.data.objects if 'volume' in x.name and
+			            x.name != module.volume.mesh.name]
 
-		for v in _volumes:  # mesh
-			if v.name != module.volume.mesh.name:
-				result = self.controller.make(module.mesh, v)
-				if result:
-					module.remove()
+		if any(self.controller.make_many(module.mesh, _volumes)):
+			module.remove()
@@ -1,3 +1,4 @@
+import numpy as np
 import os
 import sys
 
@@ -7,7 +8,67 @@ sys.path.append(file_dir)
 from dataset_config import *
 
 sys.path.append(SCRIPT_PATH)
-from pyntcloud import PyntCloud
+try:
+	from pyntcloud import PyntCloud
+except ImportError:
+	PyntCloud = None  # only needed by the 'pyntcloud' sampler
+
+
+def sample(vertices, triangles, n):
+	"""
+	Function that samples points uniformly on the surface of a triangle mesh:
+	triangles are chosen proportionally to their area, points are placed with
+	uniform barycentric coordinates.
+	:param vertices: vertices of the mesh, np.ndarray (N, 3)
+	:param triangles: triangles of the mesh, np.ndarray (M, 3) of int
+	:param n: number of points, int
+	:return: points, np.ndarray (n, 3); normals, np.ndarray (n, 3);
+	indices of the sampled triangles, np.ndarray (n,)
+	"""
+	a = vertices[triangles[:, 0]]
+	ab = vertices[triangles[:, 1]] - a
+	ac = vertices[triangles[:, 2]] - a
+	cross = np.cross(ab, ac)
+	areas = np.linalg.norm(cross, axis=1)
+	assert areas.sum() > 0, "Expected a mesh with a non-zero area"
+	faces = np.random.choice(len(triangles), size=n, p=areas / areas.sum())
+	u = np.random.random((n, 1))
+	v = np.random.random((n, 1))
+	outside = (u + v) > 1
+	u[outside] = 1 - u[outside]
+	v[outside] = 1 - v[outside]
+	points = a[faces] + u * ab[faces] + v * ac[faces]
+	normals = cross[faces] / areas[faces, None]
+	return points, normals, faces
+
+
+def write_ply(filename, points, normals, fields=None):
+	"""
+	Function that writes a point cloud as a binary .ply file.
+	:param filename: path of the file, str
+	:param points: points, np.ndarray (n, 3)
+	:param normals: normals, np.ndarray (n, 3)
+	:param fields: additional integer properties, dict {name: np.ndarray (n,)},
+	default None
+	:return:
+	"""
+	fields = fields or {}
+	dtype = [(x, '<f4') for x in ['x', 'y', 'z', 'nx', 'ny', 'nz']] + \
+	        [(x, '<i4') for x in fields]
+	data = np.empty(len(points), dtype=dtype)
+	for i, x in enumerate(['x', 'y', 'z']):
+		data[x] = points[:, i]
+		data['n' + x] = normals[:, i]
+	for name, values in fields.items():
+		data[name] = values
+	header = ['ply', 'format binary_little_endian 1.0',
+	          'element vertex {}'.format(len(points))]
+	header += ['property float {}'.format(x) for x in ['x', 'y', 'z', 'nx', 'ny', 'nz']]
+	header += ['property int {}'.format(x) for x in fields]
+	header += ['end_header']
+	with open(filename, 'wb') as f:
+		f.write(('\n'.join(header) + '\n').encode('ascii'))
+		data.tofile(f)
 
 
 # Question: how many points per building (2048) - ModelNet40
@@ -15,9 +76,34 @@ from pyntcloud import PyntCloud
 class PointCloud:
 	def __init__(self):
 		self.points = POINTS
+		self.densities = sorted(CLOUD_DENSITIES)
+
+	def make(self, filename, arrays=None):
+		"""
+		Function that makes the point cloud of a building.
+		:param filename: name of the file to write without extension, str or int
+		:param arrays: triangles of the building from blender_utils.mesh_arrays,
+		dict, default None - resample the .ply exported to CLOUD_SAVE
+		:return:
+		"""
+		if arrays is None:
+			self._make(filename)
+		else:
+			self._sample(filename, arrays)
 
-	def make(self, filename):
-		self._make(filename)
+	def files(self, filename):
+		"""
+		Function that returns the files written for a building.
+		:param filename: name of the file without extension, str or int
+		:return: paths, list of str
+		"""
+		if CLOUD_SAMPLER != 'numpy':
+			return ['{}/{}.ply'.format(CLOUD_SAVE, filename)]
+		ext = 'npz' if CLOUD_FORMAT == 'npz' else 'ply'
+		if len(self.densities) == 1:
+			return ['{}/{}.{}'.format(CLOUD_SAVE, filename, ext)]
+		return ['{}/{}_{}.{}'.format(CLOUD_SAVE, filename, n, ext)
+		        for n in self.densities]
 
 	def _make(self, filename):
 		if not CLOUD_SAVE in os.listdir():
@@ -27,7 +113,32 @@ class PointCloud:
 		                         normals=True, as_PyntCloud=True)
 		cloud.to_file("{}/{}.ply".format(CLOUD_SAVE, filename))
 
-
-
-
-
+	def _sample(self, filename, arrays):
+		"""
+		Function that samples the labelled point clouds of every density in
+		CLOUD_DENSITIES from the triangles of the building in memory and writes
+		them in the CLOUD_FORMAT format. The densest cloud is sampled once: its
+		points are independent, so every sparser cloud is its first n points.
+		:param filename: name of the file to write without extension, str or int
+		:param arrays: triangles of the building from blender_utils.mesh_arrays,
+		dict
+		:return:
+		"""
+		if not CLOUD_SAVE in os.listdir():
+			os.mkdir(CLOUD_SAVE)
+		points, normals, faces = sample(arrays['vertices'], arrays['triangles'],
+		                                max(self.densities))
+		instance = arrays['objects'][faces]
+		labels = {'semantic': arrays['ids'][instance], 'instance': instance}
+		for n in self.densities:
+			name = filename if len(self.densities) == 1 else \
+				'{}_{}'.format(filename, n)
+			fields = {x: y[:n] for x, y in labels.items()} if CLOUD_LABELS else {}
+			if CLOUD_FORMAT == 'npz':
+				np.savez_compressed('{}/{}.npz'.format(CLOUD_SAVE, name),
+				                    points=points[:n].astype(np.float32),
+				                    normals=normals[:n].astype(np.float32),
+				                    **fields)
+			else:
+				write_ply('{}/{}.ply'.format(CLOUD_SAVE, name), points[:n],
+				          normals[:n], fields)
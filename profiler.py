@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+import json
+import numpy as np
+from time import time
+
+
+class Profiler:
+	"""
+	Class that measures the time spent in every stage of the generation of each
+	sample, writes one JSON line per sample and summarizes the run.
+	"""
+	def __init__(self, filename=''):
+		"""
+		Class initialization.
+		:param filename: path of the JSONL log, str, default '' - no log
+		"""
+		self.filename = filename
+		self.current = None
+		self.times = {}  # stage: list of seconds per sample
+		self._start = 0.0
+
+	def end(self):
+		"""
+		Function that finishes the current sample and writes its timings.
+		:return: timings of the sample, dict
+		"""
+		if self.current is None:
+			return None
+		self.current['total'] = round(time() - self._start, 4)
+		for name, value in self.current['stages'].items():
+			self.times.setdefault(name, []).append(value)
+			self.current['stages'][name] = round(value, 4)
+		self.times.setdefault('total', []).append(self.current['total'])
+		if self.filename:
+			with open(self.filename, 'a') as f:
+				f.write(json.dumps(self.current) + '\n')
+		_current, self.current = self.current, None
+		return _current
+
+	def start(self, index):
+		"""
+		Function that starts measuring a new sample.
+		:param index: index of the sample, int
+		:return:
+		"""
+		self.end()
+		self.current = {'sample': index, 'stages': {}}
+		self._start = time()
+
+	@contextmanager
+	def stage(self, name):
+		"""
+		Context manager that adds the time spent inside it to a stage of the
+		current sample. Stages repeated in one sample, e.g. per view, are summed.
+		:param name: name of the stage, str
+		:return:
+		"""
+		s = time()
+		try:
+			yield
+		finally:
+			if self.current is not None:
+				_stages = self.current['stages']
+				_stages[name] = _stages.get(name, 0.0) + time() - s
+
+	def summary(self):
+		"""
+		Function that returns a table of the stage timings over all samples.
+		:return: table, str
+		"""
+		if not self.times:
+			return 'No samples were profiled'
+		_total = sum(self.times.get('total', [])) or 1.0
+		rows = ['{:<16}{:>8}{:>10}{:>10}{:>10}{:>12}{:>8}'.format(
+			'stage', 'samples', 'mean, s', 'median, s', 'max, s', 'total, s', '%')]
+		for name, values in sorted(self.times.items(), key=lambda x: -sum(x[1])):
+			rows.append('{:<16}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>12.2f}{:>8.1f}'.format(
+				name, len(values), np.mean(values), np.median(values),
+				np.max(values), sum(values), 100 * sum(values) / _total))
+		return '\n'.join(rows)
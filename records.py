@@ -0,0 +1,31 @@
+import json
+import os
+
+
+def read_records(filename):
+	"""
+	Function that reads the annotations of a .json or .jsonl annotation file.
+	Lines of a .jsonl file that cannot be parsed, e.g. the last line of an
+	interrupted run, are skipped.
+	:param filename: path of the file, str
+	:return: annotations, list of dict
+	"""
+	with open(filename) as f:
+		if not filename.endswith('.jsonl'):
+			return json.load(f)
+		records = []
+		for line in f:
+			try:
+				records.append(json.loads(line))
+			except ValueError:
+				print('Skipped an incomplete line of {}'.format(filename))
+		return records
+
+
+def sample_index(record):
+	"""
+	Function that returns the index of a sample from its annotation record.
+	:param record: annotation of a sample, dict
+	:return: index of the sample, int
+	"""
+	return int(os.path.splitext(os.path.basename(record['model']))[0])
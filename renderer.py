@@ -1,4 +1,5 @@
 import bpy, bmesh  #, bpycv
+from contextlib import contextmanager
 # import cv2
 from math import radians
 import numpy as np
@@ -9,8 +10,13 @@ import sys
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
+from blender_utils import frame
 from dataset_config import ENGINE, MASK_SAVE, IMG_SAVE, MODULES, IMAGE_SIZE, \
-	DEPTH_SAVE, RENDER_EXR, NORMALS_SAVE
+	DEPTH_SAVE, RENDER_EXR, NORMALS_SAVE, SINGLE_PASS, HEADLESS, RENDER_PROFILE, \
+	RENDER_PROFILES, ANNOTATION_SAMPLES, ANNOTATION_ENGINE, IMAGE_WRITERS, \
+	IMAGE_WRITER_STANDARD, IMAGE_WRITER_CHECK
+from image_writer import ImageWriter
+from profiler import Profiler
 from shp2obj import deselect_all
 
 
@@ -18,9 +24,20 @@ class Renderer:
 	"""
 	Class that manages the scene rendering. Incomplete.
 	"""
-	def __init__(self, mode=0):
+	def __init__(self, mode=0, single_pass=SINGLE_PASS, profiler=None,
+	             profile=RENDER_PROFILE):
 		self.engine = ENGINE
+		self.annotation_engine = ANNOTATION_ENGINE or ENGINE
+		# the annotation passes are rendered separately with their own engine
+		self.split = self.annotation_engine != self.engine
+		self.mask_material = None
 		self.mode = mode
+		self.single_pass = single_pass
+		self.profiler = profiler if profiler is not None else Profiler()
+		self.headless = HEADLESS or bpy.app.background
+		if self.headless:
+			# the Viewer node is not updated in background mode
+			self.single_pass = True
 		if self.mode == 0:
 			bpy.types.ImageFormatSettings.color_mode = 'RGBA'
 		self._scene_name = bpy.data.scenes[-1].name
@@ -31,38 +48,349 @@ class Renderer:
 		self.scene.render.image_settings.color_mode = 'RGBA'
 		self.scene.render.resolution_x = IMAGE_SIZE[0]
 		self.scene.render.resolution_y = IMAGE_SIZE[1]
+		for folder in (IMG_SAVE, MASK_SAVE, DEPTH_SAVE, NORMALS_SAVE):
+			os.makedirs(folder, exist_ok=True)
+		# the File Output nodes of single-pass renders write the passes themselves
+		self.writer = ImageWriter(0 if self.single_pass else IMAGE_WRITERS)
+		# folders of the passes compared with save_render, see IMAGE_WRITER_CHECK
+		self.checked = set()
+		if profile:
+			self.set_profile(profile)
 		self.mask_tree = MaskNodeTree(self.mode)
 		self.mask_tree.make()
 		self.depth_tree = DepthTree()
 		self.depth_tree.make()
 		self.norm_tree = NormTree()
 		self.norm_tree.make()
+		self.outputs = {}
+		if self.single_pass:
+			self._make_outputs()
 
-	def render(self, filename='new_mask_test'):
+	def render(self, filename='new_mask_test', building=None, bounds=None):
 		"""
 		Function that performs all the rendering steps: normal render, segmentation
 		mask.
 		:param filename: name of the file, str
+		:param building: building to frame, ComposedBuilding, default None -
+		frame all the objects with the VIEW_3D operator
+		:param bounds: bounding box of the building from get_bb_3d, list of float,
+		default None - framed from the building
+		:return:
+		"""
+		p = self.profiler
+		with p.stage('frame'):
+			self._frame(building, bounds)
+		if self.single_pass:
+			self._render_single(filename)
+			return
+		self.mask_tree.connect()
+		with p.stage('render_image'):
+			self._render(filename)
+
+		with p.stage('render_mask'):
+			self._render_mask(filename)
+		with self._annotation_render():
+			self.depth_tree.connect()
+			with p.stage('render_depth'):
+				bpy.ops.render.render()
+				self._render_depth(filename)
+			if RENDER_EXR:
+				self.depth_tree.connect_root()
+				with p.stage('render_exr'):
+					bpy.ops.render.render()
+					self._render_exr(filename)
+			self.norm_tree.connect()
+			with p.stage('render_normals'):
+				bpy.ops.render.render()
+				self._render_normals(filename)
+
+	def wait(self):
+		"""
+		Function that waits for the images that are still being written.
 		:return:
 		"""
+		self.writer.wait()
 
+	def set_profile(self, profile):
+		"""
+		Function that sets the render quality: sample count, adaptive sampling,
+		denoising, light path bounces and tile size. Settings missing from the
+		Blender version in use are skipped.
+		:param profile: name of a profile in RENDER_PROFILES or its settings,
+		str or dict
+		:return:
+		"""
+		if isinstance(profile, str):
+			assert profile in RENDER_PROFILES, "Unknown render profile {}, " \
+			                                   "expected one of {}".format(
+				profile, list(RENDER_PROFILES))
+			profile = RENDER_PROFILES[profile]
+		bounces = profile['max_bounces']
+		settings = {'samples': profile['samples'],
+		            'use_adaptive_sampling': profile['adaptive_threshold'] > 0,
+		            'adaptive_threshold': profile['adaptive_threshold'],
+		            'use_denoising': profile['denoise'],
+		            'max_bounces': bounces,
+		            'diffuse_bounces': min(bounces, 4),
+		            'glossy_bounces': min(bounces, 4),
+		            'transmission_bounces': bounces,
+		            'transparent_max_bounces': bounces,
+		            'volume_bounces': 0,
+		            'use_auto_tile': True,
+		            'tile_size': profile['tile']}
+		self._set(getattr(self.scene, 'cycles', None), settings)
+		self._set(self.scene.render, {'tile_x': profile['tile'],
+		                              'tile_y': profile['tile']})
+		self._set(getattr(self.scene, 'eevee', None),
+		          {'taa_render_samples': profile['samples']})
+
+	@contextmanager
+	def _annotation_render(self):
+		"""
+		Context manager that renders with the annotation engine at minimal
+		quality. With a separate annotation engine the objects are drawn with
+		the mask material, which colors them by pass index as MaskNodeTree
+		does, since the object index pass is only rendered by Cycles.
+		:return:
+		"""
+		render = self.scene.render
+		view_layer = self.scene.view_layers["View Layer"]
+		engine, override = render.engine, view_layer.material_override
+		transparent = render.film_transparent
+		render.engine = self.annotation_engine
+		if self.split:
+			view_layer.material_override = self._mask_material()
+			render.film_transparent = True
+		try:
+			with self._annotation_quality():
+				yield
+		finally:
+			render.engine = engine
+			view_layer.material_override = override
+			render.film_transparent = transparent
+
+	@contextmanager
+	def _annotation_quality(self):
+		"""
+		Context manager that renders at ANNOTATION_SAMPLES samples without
+		denoising, for the passes that are read from the render layers and need
+		no noise reduction.
+		:return:
+		"""
+		settings = {'samples': ANNOTATION_SAMPLES, 'use_adaptive_sampling': False,
+		            'use_denoising': False}
+		eevee = {'taa_render_samples': ANNOTATION_SAMPLES}
+		cycles = getattr(self.scene, 'cycles', None)
+		previous = self._set(cycles, settings)
+		previous_eevee = self._set(getattr(self.scene, 'eevee', None), eevee)
+		try:
+			yield
+		finally:
+			self._set(cycles, previous)
+			self._set(getattr(self.scene, 'eevee', None), previous_eevee)
+
+	def _mask_material(self):
+		"""
+		Function that makes the material that colors every object with the mask
+		color of its pass index: hue index / (len(MODULES) + 2), black for 0.
+		:return: mask material, bpy material
+		"""
+		if self.mask_material is not None:
+			return self.mask_material
+		material = bpy.data.materials.new('annotation_mask')
+		material.use_fake_user = True
+		material.use_nodes = True
+		nodes, links = material.node_tree.nodes, material.node_tree.links
+		nodes.clear()
+		info = nodes.new('ShaderNodeObjectInfo')
+		hue = nodes.new('ShaderNodeMath')
+		hue.operation = 'DIVIDE'
+		hue.inputs[1].default_value = len(MODULES) + 2
+		value = nodes.new('ShaderNodeMath')
+		value.operation = 'GREATER_THAN'
+		value.inputs[1].default_value = 0.5
+		try:
+			color = nodes.new('ShaderNodeCombineColor')
+			color.mode = 'HSV'
+		except RuntimeError:  # before Blender 3.3
+			color = nodes.new('ShaderNodeCombineHSV')
+		color.inputs[1].default_value = 1.0
+		emission = nodes.new('ShaderNodeEmission')
+		output = nodes.new('ShaderNodeOutputMaterial')
+		links.new(info.outputs['Object Index'], hue.inputs[0])
+		links.new(info.outputs['Object Index'], value.inputs[0])
+		links.new(hue.outputs[0], color.inputs[0])
+		links.new(value.outputs[0], color.inputs[2])
+		links.new(color.outputs[0], emission.inputs['Color'])
+		links.new(emission.outputs[0], output.inputs['Surface'])
+		self.mask_material = material
+		return material
+
+	@contextmanager
+	def _muted(self, mute=True):
+		"""
+		Context manager that keeps the File Output nodes from writing.
+		:param mute: whether to mute the nodes, bool, default True
+		:return:
+		"""
+		for node, _, _ in self.outputs.values():
+			node.mute = mute
+		try:
+			yield
+		finally:
+			for node, _, _ in self.outputs.values():
+				node.mute = False
+
+	@contextmanager
+	def _standard_view(self, standard=True):
+		"""
+		Context manager that saves images with the Standard view transform
+		instead of the view transform of the scene, e.g. Filmic.
+		:param standard: whether to change the view transform, bool, default
+		True
+		:return:
+		"""
+		view = self.scene.view_settings
+		previous = {}
+		if standard:
+			previous = self._set(view, {'view_transform': 'Standard', 'look': 'None',
+			                            'exposure': 0.0, 'gamma': 1.0})
+		try:
+			yield
+		finally:
+			self._set(view, previous)
+
+	def _standard(self):
+		"""
+		Function that checks whether the scene saves images with the Standard view
+		transform, the only one the image writer reproduces.
+		:return: bool
+		"""
+		view = self.scene.view_settings
+		return view.view_transform == 'Standard' and view.look == 'None' and \
+		       view.exposure == 0 and view.gamma == 1 and \
+		       not getattr(view, 'use_curve_mapping', False)
+
+	def _set(self, target, settings):
+		"""
+		Function that sets the existing attributes of a settings block.
+		:param target: settings block, e.g. scene.cycles, or None
+		:param settings: values by attribute name, dict
+		:return: previous values of the attributes that were set, dict
+		"""
+		previous = {}
+		for key, value in settings.items():
+			if hasattr(target, key):
+				previous[key] = getattr(target, key)
+				setattr(target, key, value)
+		return previous
+
+	def render_views(self, filenames, poses, building=None, camera=None,
+	                 on_view=None):
+		"""
+		Function that renders several views of one building back to back. The
+		render data is kept between the views (persistent data), only the
+		camera moves. The bounding box of the building is computed once, every
+		view is framed from it without VIEW_3D operators.
+		:param filenames: names of the files of every view, list of str
+		:param poses: rotations of the camera, np.ndarray (N, 3) of Euler angles
+		in radians, see CameraManager.poses, the Y angle (roll) of the camera is
+		kept
+		:param building: building to frame, ComposedBuilding, default None
+		:param camera: camera to move, blender camera object, default None - the
+		active camera
+		:param on_view: function called with the number of the view before it is
+		rendered, e.g. to change the lights, default None
+		:return:
+		"""
+		assert len(filenames) == len(poses), "Expected a file name per pose, " \
+		                                     "got {} and {}".format(len(filenames),
+		                                                            len(poses))
+		if camera is not None:
+			self.scene.camera = camera
+		bounds = None
+		if building is not None:
+			with self.profiler.stage('frame'):
+				bounds = building.get_bb_3d()
+		persistent = self.scene.render.use_persistent_data
+		self.scene.render.use_persistent_data = True
+		try:
+			for k, (filename, pose) in enumerate(zip(filenames, poses)):
+				self.scene.camera.rotation_euler[0] = pose[0]
+				self.scene.camera.rotation_euler[2] = pose[2]
+				if on_view is not None:
+					on_view(k)
+				self.render(filename, building=building, bounds=bounds)
+		finally:
+			self.scene.render.use_persistent_data = persistent
+
+	def _frame(self, building=None, bounds=None):
+		"""
+		Function that moves the active camera so that the building is in the frame.
+		In headless mode or with given bounds the position is computed from the
+		building bounding box.
+		:param building: building to frame, ComposedBuilding, default None
+		:param bounds: bounding box of the building, list of float, default None
+		:return:
+		"""
+		if bounds is not None:
+			frame(self.scene.camera, bounds)
+			return
+		if self.headless:
+			assert building is not None, "Headless rendering needs the building " \
+			                             "to frame the camera"
+			frame(self.scene.camera, building.get_bb_3d())
+			return
 		deselect_all(True)
 		bpy.ops.view3d.camera_to_view_selected()
 		deselect_all()
-		self.mask_tree.connect()
-		self._render(filename)
 
-		self._render_mask(filename)
-		self.depth_tree.connect()
-		bpy.ops.render.render()
-		self._render_depth(filename)
+	def _make_outputs(self):
+		"""
+		Function that adds File Output nodes for every annotation pass, so that
+		they are written by the same render as the image.
+		:return:
+		"""
+		if self.split:
+			mask = self.mask_tree.make_image_output(MASK_SAVE)
+		else:
+			mask = self.mask_tree.make_output(MASK_SAVE)
+		self.outputs = {'mask': (mask, MASK_SAVE, '_mask.png'),
+		                'depth': (self.depth_tree.make_output(DEPTH_SAVE), DEPTH_SAVE,
+		                          '_depth.png'),
+		                'normals': (self.norm_tree.make_output(NORMALS_SAVE),
+		                            NORMALS_SAVE, '_normals.png')}
 		if RENDER_EXR:
-			self.depth_tree.connect_root()
-			bpy.ops.render.render()
-			self._render_exr(filename)
-		self.norm_tree.connect()
-		bpy.ops.render.render()
-		self._render_normals(filename)
+			self.outputs['exr'] = (self.depth_tree.make_root_output(DEPTH_SAVE),
+			                       DEPTH_SAVE, '_depth.exr')
+
+	def _render_single(self, filename):
+		"""
+		Function that renders the image and all the annotation passes with one
+		render call, or with a second render when the annotation passes have
+		their own engine. The File Output nodes append the frame number to the
+		file name, so the files are renamed afterwards.
+		:param filename: name of the file, str
+		:return:
+		"""
+		p = self.profiler
+		for key, (node, folder, suffix) in self.outputs.items():
+			node.file_slots[0].path = '{}_{}_'.format(filename, key)
+		with p.stage('render'):
+			with self._muted(self.split):
+				self._render(filename)
+		if self.split:
+			with p.stage('render_annotations'), self._annotation_render():
+				bpy.ops.render.render()
+		frame_number = self.scene.frame_current
+		for key, (node, folder, suffix) in self.outputs.items():
+			_path = '{}/{}_{}_{:04d}{}'.format(folder, filename, key,
+			                                   frame_number,
+			                                   os.path.splitext(suffix)[1])
+			if os.path.exists(_path):
+				os.replace(_path, '{}/{}{}'.format(folder, filename, suffix))
+			else:
+				print('Pass {} was not written for {}'.format(key, filename))
 
 	def _render_bpycv(self, filename='test'):
 		"""
@@ -86,8 +414,6 @@ class Renderer:
 		image_settings.color_depth = '8'
 		bpy.data.scenes[self._scene_name].render.engine = self.engine
 		bpy.ops.render.render()
-		if not IMG_SAVE in os.listdir():
-			os.mkdir(IMG_SAVE)
 		bpy.data.images["Render Result"].save_render(
 			'{}/{}.png'.format(IMG_SAVE, filename))
 
@@ -98,17 +424,12 @@ class Renderer:
 		"""
 		if len(bpy.data.images) == 0:
 			bpy.ops.render.render()
-		if not DEPTH_SAVE in os.listdir():
-			os.mkdir(DEPTH_SAVE)
-		bpy.data.images["Viewer Node"].save_render(
-			'{}/{}_depth.png'.format(DEPTH_SAVE, filename))
+		self._save_viewer('{}/{}_depth.png'.format(DEPTH_SAVE, filename))
 
 	def _render_exr(self, filename):
 		image_settings = bpy.context.scene.render.image_settings
 		image_settings.file_format = "OPEN_EXR"
 		image_settings.color_depth = '32'
-		if not DEPTH_SAVE in os.listdir():
-			os.mkdir(DEPTH_SAVE)
 		bpy.data.images["Viewer Node"].save_render(
 			'{}/{}_depth.exr'.format(DEPTH_SAVE, filename))
 
@@ -119,10 +440,7 @@ class Renderer:
 		"""
 		if len(bpy.data.images) == 0:
 			bpy.ops.render.render()
-		if not MASK_SAVE in os.listdir():
-			os.mkdir(MASK_SAVE)
-		bpy.data.images["Viewer Node"].save_render(
-			'{}/{}_mask.png'.format(MASK_SAVE, filename))
+		self._save_viewer('{}/{}_mask.png'.format(MASK_SAVE, filename))
 
 	def _render_normals(self, filename):
 		"""
@@ -131,10 +449,57 @@ class Renderer:
 		"""
 		if len(bpy.data.images) == 0:
 			bpy.ops.render.render()
-		if not NORMALS_SAVE in os.listdir():
-			os.mkdir(NORMALS_SAVE)
-		bpy.data.images["Viewer Node"].save_render(
-			'{}/{}_normals.png'.format(NORMALS_SAVE, filename))
+		self._save_viewer('{}/{}_normals.png'.format(NORMALS_SAVE, filename))
+
+	def _save_viewer(self, path):
+		"""
+		Function that saves the Viewer Node image as a .png file. The pixels are
+		copied and encoded by the image writer in the background. The writer
+		only reproduces the Standard view transform: with another view transform
+		the image is saved with save_render, unless IMAGE_WRITER_STANDARD.
+		:param path: path of the file, str
+		:return:
+		"""
+		image = bpy.data.images["Viewer Node"]
+		if self.writer.pool is None or not (IMAGE_WRITER_STANDARD or
+		                                    self._standard()):
+			image.save_render(path)
+			return
+		width, height = image.size
+		pixels = np.empty(width * height * 4, dtype=np.float32)
+		image.pixels.foreach_get(pixels)
+		self.writer.write(path, pixels.reshape(height, width, 4))
+		if IMAGE_WRITER_CHECK and os.path.dirname(path) not in self.checked:
+			self.checked.add(os.path.dirname(path))
+			self.check_writer(path, image)
+
+	def check_writer(self, path, image):
+		"""
+		Function that compares an image written by the image writer with the
+		same image saved by save_render and prints the largest difference.
+		:param path: path of the image written by the image writer, str
+		:param image: image that was written, Blender image
+		:return: largest difference in 8 bit levels, int
+		"""
+		self.writer.wait()
+		_path = '{}_check.png'.format(os.path.splitext(path)[0])
+		with self._standard_view(IMAGE_WRITER_STANDARD):
+			image.save_render(_path)
+		pixels = []
+		for x in (path, _path):
+			_image = bpy.data.images.load(x)
+			_pixels = np.empty(len(_image.pixels), dtype=np.float32)
+			_image.pixels.foreach_get(_pixels)
+			bpy.data.images.remove(_image)
+			pixels.append(_pixels)
+		os.remove(_path)
+		if pixels[0].shape != pixels[1].shape:
+			print('Image writer: {} has another size than save_render'.format(path))
+			return 255
+		difference = int(round(np.abs(pixels[0] - pixels[1]).max() * 255))
+		print('Image writer: {} differs from save_render by {} '
+		      'levels'.format(path, difference))
+		return difference
 
 	def _render_keypoints(self):
 		"""
@@ -183,6 +548,17 @@ class Tree:
 		self.output_node.update()
 
 
+	def make_output(self, directory, file_format='PNG', color_depth='8'):
+		"""
+		Function that connects the tree result to a new File Output node.
+		:param directory: directory to write the pass to, str
+		:param file_format: file format of the pass, str, default 'PNG'
+		:param color_depth: color depth of the pass, str, default '8'
+		:return: file output node, node
+		"""
+		return self._make_output(self._result(), directory, file_format,
+		                         color_depth)
+
 	def make(self):
 		"""
 		Function that builds the entire node tree for instance segmentation and
@@ -196,6 +572,33 @@ class Tree:
 
 		return True
 
+	def _make_output(self, socket, directory, file_format, color_depth):
+		"""
+		Function that creates a File Output node fed by a given socket.
+		:param socket: output socket to save, node socket
+		:param directory: directory to write the pass to, str
+		:param file_format: file format of the pass, str
+		:param color_depth: color depth of the pass, str
+		:return: file output node, node
+		"""
+		node = self.scene.node_tree.nodes.new(type="CompositorNodeOutputFile")
+		node.base_path = directory
+		node.format.file_format = file_format
+		node.format.color_depth = color_depth
+		if file_format == 'PNG':
+			node.format.color_mode = 'RGBA'
+		self._place_node(node, self.output_node, 0)
+		_ = self.links.new(socket, node.inputs[0])
+		return node
+
+	def _result(self):
+		"""
+		Function that returns the output socket of the tree result.
+		:return: output socket, node socket
+		"""
+		result_node = self.scene.node_tree.nodes[self.name]
+		return result_node.outputs[result_node.outputs.keys()[0]]
+
 	def _place_node(self, node, prev_node, axis):
 		"""
 		Function that places a node near the previous one aligned along one axis.
@@ -233,6 +636,15 @@ class DepthTree(Tree):
 		self.scene.node_tree.nodes.active = self.output_node
 		self.output_node.update()
 
+	def make_root_output(self, directory):
+		"""
+		Function that connects the raw z data to a new File Output node.
+		:param directory: directory to write the pass to, str
+		:return: file output node, node
+		"""
+		return self._make_output(self.root_node.outputs["Depth"], directory,
+		                         'OPEN_EXR', '32')
+
 	def _make(self):
 		result_node = self.scene.node_tree.nodes.new(
 			type="CompositorNodeNormalize")
@@ -262,6 +674,16 @@ class MaskNodeTree(Tree):
 		for index in range(1, len(MODULES) + 2):
 			result_node = self._material_branch(index, result_node)
 
+	def make_image_output(self, directory):
+		"""
+		Function that connects the rendered image to a new File Output node, for
+		masks rendered with the mask material instead of the object index pass.
+		:param directory: directory to write the mask to, str
+		:return: file output node, node
+		"""
+		return self._make_output(self.root_node.outputs["Image"], directory,
+		                         'PNG', '8')
+
 	def _make_add_node(self, node1, node2):
 		"""
 		Function that combines two nodes together summing their values.
@@ -374,6 +796,9 @@ class NormTree(Tree):
 		self.scene.node_tree.nodes.active = self.output_node
 		self.output_node.update()
 
+	def _result(self):
+		return self.root_node.outputs["Normal"]
+
 
 if __name__ == '__main__':
 
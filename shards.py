@@ -0,0 +1,142 @@
+import io
+import json
+import os
+import sys
+import tarfile
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import SHARD_SAVE, SHARD_SIZE, SHARD_KEEP_FILES
+
+
+def remove_temporary(directory, prefix):
+	"""
+	Function that removes the shards left open by interrupted runs. To be
+	called when no writer of these shards is running, e.g. by launcher.py
+	before it starts the workers.
+	:param directory: directory of the shards, str
+	:param prefix: prefix of the shard names, str
+	:return: number of removed files, int
+	"""
+	if not os.path.isdir(directory):
+		return 0
+	files = [x for x in os.listdir(directory)
+	         if x.startswith(prefix) and x.endswith('.tar.tmp')]
+	for x in files:
+		os.remove('{}/{}'.format(directory, x))
+	return len(files)
+
+
+class ShardWriter:
+	"""
+	Class that packs the files of every sample into sequential .tar shards, in
+	the WebDataset layout: the members of a sample are named {key}.{extension}
+	and follow each other. A shard is closed when it would exceed its size.
+	"""
+	def __init__(self, name, size=SHARD_SIZE, keep=SHARD_KEEP_FILES):
+		"""
+		Class initialization.
+		:param name: name of the dataset, prefix of the shards, str
+		:param size: maximum size of a shard in bytes, int, a larger sample gets
+		a shard of its own
+		:param keep: whether to keep the packed files on disk, bool
+		"""
+		self.name = name
+		self.size = size
+		self.keep = keep
+		self.directory = SHARD_SAVE
+		os.makedirs(self.directory, exist_ok=True)
+		self.number = len(self.shards())
+		self.tar = None
+		self.path = None
+		# files of the open shard, removed once the shard is complete
+		self.packed = []
+
+	def write(self, key, members, record=None):
+		"""
+		Function that packs one sample into the open shard.
+		:param key: key of the sample, str
+		:param members: paths of the files by member extension, dict
+		:param record: annotation of the sample, stored as {key}.json, dict
+		:return:
+		"""
+		members = dict(members)
+		for ext, path in list(members.items()):
+			if not os.path.isfile(path):
+				print('File {} of sample {} was not written'.format(path, key))
+				del members[ext]
+		data = json.dumps(record).encode('utf-8') if record is not None else None
+		size = sum(os.path.getsize(x) for x in members.values()) + \
+		       (len(data) if data is not None else 0)
+		if self.tar is not None and self.tar.fileobj.tell() + size > self.size:
+			self.close()
+		if self.tar is None:
+			self._open()
+		for ext, path in members.items():
+			self.tar.add(path, arcname='{}.{}'.format(key, ext))
+		if data is not None:
+			info = tarfile.TarInfo('{}.json'.format(key))
+			info.size = len(data)
+			self.tar.addfile(info, io.BytesIO(data))
+		self.packed += list(members.values())
+
+	def close(self):
+		"""
+		Function that completes the open shard and removes its packed files if
+		they are not kept.
+		:return:
+		"""
+		if self.tar is None:
+			return
+		self.tar.close()
+		self.tar.fileobj.close()
+		os.replace(self.path + '.tmp', self.path)
+		self.tar = None
+		if not self.keep:
+			for path in self.packed:
+				if os.path.isfile(path):
+					os.remove(path)
+		self.packed = []
+
+	def keys(self):
+		"""
+		Function that returns the keys of the samples packed in the complete
+		shards.
+		:return: keys, set of str
+		"""
+		keys = set()
+		for path in self.shards():
+			with tarfile.open(path) as tar:
+				keys.update(x.split('.')[0] for x in tar.getnames())
+		return keys
+
+	def shards(self):
+		"""
+		Function that returns the complete shards of the dataset.
+		:return: paths, list of str
+		"""
+		return sorted('{}/{}'.format(self.directory, x)
+		              for x in os.listdir(self.directory)
+		              if x.startswith(self.name + '-') and x.endswith('.tar'))
+
+	def _open(self):
+		"""
+		Function that opens the next free shard, under a temporary name until it
+		is complete. The temporary file is created exclusively, so that two
+		writers of the same dataset never share a shard; the temporary files
+		of interrupted runs are skipped and removed by remove_temporary.
+		:return:
+		"""
+		while True:
+			self.path = '{}/{}-{:06d}.tar'.format(self.directory, self.name,
+			                                      self.number)
+			self.number += 1
+			if os.path.exists(self.path):
+				continue
+			try:
+				stream = open(self.path + '.tmp', 'xb')
+			except FileExistsError:
+				continue
+			break
+		self.tar = tarfile.open(fileobj=stream, mode='w')
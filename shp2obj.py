@@ -9,6 +9,7 @@ file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 from annotation import Annotation
 from blender_utils import get_min_max
+from bounds import invalidate
 
 
 class Building:
@@ -150,6 +151,7 @@ class BlenderReader:
 		deselect_all()
 		for mesh in to_clean:
 			try:
+				invalidate(mesh)
 				mesh.select_set(True)
 				bpy.ops.object.delete()
 			except Exception:
@@ -0,0 +1,576 @@
+import argparse
+import ast
+import hashlib
+import json
+import math
+import numpy as np
+import os
+import random
+import sys
+import textwrap
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import BUILDINGS, MAX_HEIGHT, MAX_LENGTH, MAX_WIDTH, \
+	MIN_HEIGHT, MIN_LENGTH, MIN_WIDTH, MODULES
+
+# Building description that does not need Blender: the typology, the boxes of
+# the volumes and the module grids are drawn with NumPy only, the Blender
+# objects are made from a spec by BuildingFactory.realise in generator.py.
+
+# module classes of module.py by module name
+MODULE_KINDS = {'window': ['ParametricWindow'],
+                'balcony': ['Balcony'],
+                'roof': ['Roof', 'SlopedRoof']}
+
+
+def module_shapes(kinds, path=os.path.join(file_dir, 'module.py')):
+	"""
+	Function that reads the default scale and vertical offset of module classes
+	from module.py, which can not be imported without Blender.
+	:param kinds: names of the module classes, iterable of str
+	:param path: path of module.py, str
+	:return: scale and vertical offset by class name, dict {name: (scale, y_offset)}
+	"""
+	with open(path) as f:
+		tree = ast.parse(f.read())
+	classes = {x.name: x for x in tree.body if isinstance(x, ast.ClassDef)}
+
+	def shape(name):
+		scale, y_offset = None, None
+		for f in classes[name].body:
+			if not isinstance(f, ast.FunctionDef) or f.name != '__init__':
+				continue
+			args = f.args.args[len(f.args.args) - len(f.args.defaults):]
+			for arg, default in zip(args, f.args.defaults):
+				if arg.arg == 'scale':
+					scale = ast.literal_eval(default)
+			for node in ast.walk(f):
+				if isinstance(node, ast.Assign) and \
+						any(isinstance(x, ast.Attribute) and x.attr == 'y_offset'
+						    for x in node.targets):
+					y_offset = ast.literal_eval(node.value)
+		for base in classes[name].bases:
+			if isinstance(base, ast.Name) and base.id in classes:
+				_scale, _y_offset = shape(base.id)
+				scale = _scale if scale is None else scale
+				y_offset = _y_offset if y_offset is None else y_offset
+		return scale, y_offset
+
+	return {x: shape(x) for x in kinds}
+
+
+# default scale and vertical offset of the module classes, used to lay out
+# the module grids
+MODULE_SHAPES = module_shapes([x for y in MODULE_KINDS.values() for x in y])
+MODULE_OFFSET = (2.0, 1.0, 2.0, 1.0)  # offset of the module grids from the borders of the facade
+
+
+def grid_positions(axis, xs, hs):
+	"""
+	Function that computes the offsets of a grid of modules.
+	:param axis: axis the module is connected along, int
+	:param xs: horizontal offsets, iterable of int
+	:param hs: vertical offsets, iterable of int
+	:return: offsets, np.ndarray (len(xs) * len(hs), 3)
+	"""
+	xs, hs = np.meshgrid(np.asarray(xs, dtype=int), np.asarray(hs, dtype=int),
+	                     indexing='ij')
+	positions = np.zeros((xs.size, 3), dtype=int)
+	positions[:, abs(1 - axis)] = xs.ravel()
+	positions[:, 2] = hs.ravel()
+	return positions
+
+
+def applier_positions(rule, axis, scale, y_offset, extent, height,
+                      offset=(1.0, 1.0, 1.0, 1.0), step=None, grid=None):
+	"""
+	Function that computes the offsets of the copies of a module placed on a
+	facade by a module applier.
+	:param rule: rule of the applier, str, one of 'grid', 'column', 'row',
+	'random', 'single'
+	:param axis: axis the module is connected along, int
+	:param scale: scale of the module, tuple (x, y, z)
+	:param y_offset: vertical offset of the module, float
+	:param extent: width of the facade, float
+	:param height: height of the facade, float
+	:param offset: offset from the borders of the volume, tuple
+	(left, bottom, right, top), default = (1.0, 1.0, 1.0, 1.0)
+	:param step: parameter of the grid, tuple (hor_step, vert_step),
+	default=None
+	:param grid: parameters of the grid, tuple (rows, cols), int. If step is
+	given, not taken into account
+	:return: offsets from the connected module, np.ndarray (N, 3) of int
+	"""
+	if rule not in ['grid', 'column', 'row', 'random']:
+		return np.zeros((0, 3), dtype=int)
+	_start1 = int(offset[0] + scale[abs(1 - axis)] / 2)
+	_start2 = int(offset[1] + y_offset + scale[2] / 2)
+	_end1 = int(extent - (int(offset[2] + scale[abs(1 - axis)] / 2)))
+	_end2 = int(height - (int(offset[2] + scale[abs(1 - axis)] / 2)))
+
+	if step:
+		step_x, step_h = step
+	else:
+		step_x, step_h = int((_end1 - _start1) / grid[0]), \
+		                 int((_end2 - _start2) / grid[1])
+		if step_x == 0:
+			step_x = math.ceil((_end1 - _start1) / grid[0])
+		if step_h == 0:
+			step_h = math.ceil((_end2 - _start2) / grid[1])
+
+	if rule == 'column':
+		col_number = np.random.randint(1, max(2, int((_end1 - _start1) / step_x)))
+		columns = list(set(np.random.randint(0, int((_end1 - _start1) / step_x),
+		                                     size=col_number)))
+		return grid_positions(axis, int(_start1) + int(step_x) * np.array(columns),
+		                      range(_start2, _end2, int(step_h)))
+	if rule == 'row':
+		row_number = np.random.randint(1, max(2, int((_end1 - _start1) / step_x)))
+		rows = list(set(np.random.randint(0, int((_end2 - _start2) / step_h),
+		                                  size=row_number)))
+		return np.concatenate([grid_positions(
+			axis, range(_start1, _end1, int(step_x)),
+			[int(_start2) + int(step_h) * row]) for row in rows])
+	positions = grid_positions(axis, range(_start1, _end1, int(step_x)),
+	                           range(_start2, _end2, int(step_h)))
+	if rule == 'random':
+		positions = positions[np.random.random(len(positions)) > 0.5]
+	return positions
+
+
+class ModuleSpec:
+	"""
+	Class that describes the modules of one facade of a volume.
+	"""
+	def __init__(self, name, kind, axis, side, step, positions):
+		"""
+		Class initialization.
+		:param name: name of the module in MODULES, str
+		:param kind: name of the module class in module.py, str
+		:param axis: axis the module is connected along, int
+		:param side: side of the axis the module is connected to, int
+		:param step: step of the module grid, tuple (hor_step, vert_step)
+		:param positions: offsets of the copies from the connected module,
+		np.ndarray (N, 3) of int
+		"""
+		self.name = name
+		self.kind = kind
+		self.axis = axis
+		self.side = side
+		self.step = tuple(float(x) for x in step)
+		self.positions = np.asarray(positions, dtype=int).reshape(-1, 3)
+
+	def to_dict(self):
+		return {'name': self.name, 'kind': self.kind, 'axis': self.axis,
+		        'side': self.side, 'step': list(self.step),
+		        'positions': self.positions.tolist()}
+
+	@classmethod
+	def from_dict(cls, d):
+		return cls(d['name'], d['kind'], d['axis'], d['side'], d['step'],
+		           d['positions'])
+
+
+class VolumeSpec:
+	"""
+	Class that describes one volume of a building: a box standing on the
+	ground, rotated around the vertical axis.
+	"""
+	def __init__(self, width, length, height, floor, location=(0.0, 0.0),
+	             rotation=0, modules=None):
+		"""
+		Class initialization.
+		:param width: half size of the volume along y, float
+		:param length: half size of the volume along x, float
+		:param height: height of the volume, float
+		:param floor: floor height, float
+		:param location: location of the center of the volume, tuple (x, y)
+		:param rotation: rotation around the vertical axis in degrees, 0 or 90
+		:param modules: modules of the facades, list of ModuleSpec
+		"""
+		self.width = float(width)
+		self.length = float(length)
+		self.height = float(height)
+		self.floor = float(floor)
+		self.location = tuple(float(x) for x in location)
+		self.rotation = int(rotation)
+		self.modules = modules or []
+
+	@property
+	def extent(self):
+		"""
+		Size of the volume along x and y, the plane of the volume has size 2 and
+		is scaled by (length, width).
+		:return: extent, tuple (x, y)
+		"""
+		if self.rotation % 180:
+			return 2 * self.width, 2 * self.length
+		return 2 * self.length, 2 * self.width
+
+	@property
+	def bounds(self):
+		"""
+		Bounding box of the volume.
+		:return: bounds, np.ndarray (2, 3) [[x_min, y_min, z_min],
+		[x_max, y_max, z_max]]
+		"""
+		half = np.array(self.extent) / 2
+		center = np.array(self.location)
+		return np.array([list(center - half) + [0.0],
+		                 list(center + half) + [self.height]])
+
+	def to_dict(self):
+		return {'width': self.width, 'length': self.length,
+		        'height': self.height, 'floor': self.floor,
+		        'location': list(self.location), 'rotation': self.rotation,
+		        'modules': [x.to_dict() for x in self.modules]}
+
+	@classmethod
+	def from_dict(cls, d):
+		return cls(d['width'], d['length'], d['height'], d['floor'],
+		           d['location'], d['rotation'],
+		           [ModuleSpec.from_dict(x) for x in d['modules']])
+
+
+class BuildingSpec:
+	"""
+	Class that describes a building independently of Blender.
+	"""
+	def __init__(self, typology, volumes):
+		"""
+		Class initialization.
+		:param typology: name of the building typology, str
+		:param volumes: volumes of the building, list of VolumeSpec
+		"""
+		self.typology = typology
+		self.volumes = volumes
+
+	@property
+	def bounds(self):
+		"""
+		Bounding box of the building volumes.
+		:return: bounds, np.ndarray (2, 3)
+		"""
+		bounds = np.array([x.bounds for x in self.volumes])
+		return np.array([bounds[:, 0].min(axis=0), bounds[:, 1].max(axis=0)])
+
+	def json(self):
+		return json.dumps(self.to_dict())
+
+	def key(self):
+		"""
+		Function that returns a key identifying the geometry of the building,
+		used to find duplicates.
+		:return: key, str
+		"""
+		d = self.to_dict()
+		for v in d['volumes']:
+			for x in ['width', 'length', 'height', 'floor']:
+				v[x] = round(v[x], 3)
+			v['location'] = [round(x, 3) for x in v['location']]
+		return hashlib.sha1(json.dumps(d, sort_keys=True).encode()).hexdigest()
+
+	def to_dict(self):
+		return {'typology': self.typology,
+		        'volumes': [x.to_dict() for x in self.volumes]}
+
+	@classmethod
+	def from_dict(cls, d):
+		return cls(d['typology'], [VolumeSpec.from_dict(x) for x in d['volumes']])
+
+	@classmethod
+	def from_json(cls, s):
+		return cls.from_dict(json.loads(s))
+
+
+def attach(coords1, size2, axis, border1=0, border2=0):
+	"""
+	Function that computes the location of a volume attached to another one,
+	the placement rule of gancio in blender_utils.py and of the building specs.
+	:param coords1: limits of the volume to attach to, [(x_min, x_max),
+	(y_min, y_max)]
+	:param size2: size of the attached volume, (x, y)
+	:param axis: axis along which the volume will be attached, 0 - x, 1 - y
+	:param border1: max or min side of the axis, 0 - min, 1 - max
+	:param border2: max or min side of the opposite axis, 0 - min, 1 - max
+	:return: location of the center of the attached volume along axis and
+	along the opposite axis, tuple of float
+	"""
+	mapping = {0: -1, 1: 1}
+	other = abs(1 - axis)
+	location = coords1[axis][border1] + 0.5 * size2[axis] * mapping[border1]
+	location_other = coords1[other][border2] + \
+	                 mapping[abs(1 - border2)] * (coords1[other][1] - coords1[other][0]) + \
+	                 0.5 * size2[other] * mapping[border2]
+	return float(location), float(location_other)
+
+
+def side_location(coords1, length, width, along):
+	"""
+	Function that computes a random location of a volume standing outside one
+	side of another one, as in the T- and E-shaped buildings.
+	:param coords1: limits of the volume to place along, [(x_min, x_max),
+	(y_min, y_max)]
+	:param length: half size of the placed volume along x, float
+	:param width: half size of the placed volume along y, float
+	:param along: side of the volume, 0 - along x at y_min, 1 - along y at x_min
+	:return: location, tuple (x, y)
+	"""
+	(x_min, x_max), (y_min, y_max) = coords1
+	if along == 0:
+		return random.choice(np.linspace(int(x_min + length), int(x_max - length),
+		                                 10)), y_min - width
+	return x_min - length, random.choice(np.linspace(int(y_min + width),
+	                                                 int(y_max - width), 10))
+
+
+def link_l(volumes, gancio):
+	"""
+	Function that links the volumes of an L-shaped building.
+	:param volumes: volumes sorted by length, longest first, list
+	:param gancio: function that attaches the second volume to the first one,
+	gancio(v1, v2, axis, border1, border2)
+	:return:
+	"""
+	gancio(volumes[0], volumes[1], 0, 0, 0)
+
+
+def link_c(volumes, gancio, rotate):
+	"""
+	Function that links the volumes of a C-shaped building.
+	:param volumes: volumes sorted by length, longest first, list
+	:param gancio: function that attaches the second volume to the first one,
+	gancio(v1, v2, axis, border1, border2)
+	:param rotate: function that rotates a volume by 90 degrees
+	:return:
+	"""
+	for v in volumes[1:]:
+		if v.width < v.length:
+			rotate(v)
+	gancio(volumes[0], volumes[1], 0, 1, 0)
+	gancio(volumes[0], volumes[2], 0, 0, 0)
+
+
+def link_patio(volumes, gancio, rotate):
+	"""
+	Function that links the volumes of a patio building in a circular or a cap
+	linkage.
+	:param volumes: volumes, list
+	:param gancio: function that attaches the second volume to the first one,
+	gancio(v1, v2, axis, border1, border2)
+	:param rotate: function that rotates a volume by 90 degrees
+	:return:
+	"""
+	if np.random.random() < 0.5:
+		# circular linkage between buildings
+		links = [(0, 1, 1), (1, 1, 0), (0, 0, 0)]
+	else:
+		# cap linkage between buildings
+		links = [(1, 1, 0), (1, 1, 0), (1, 0, 1)]
+	for i, _v in enumerate(volumes[:-1]):
+		if i % 2 == 0:
+			rotate(volumes[i + 1])
+		if i < len(links):
+			gancio(_v, volumes[i + 1], *links[i])
+
+
+def gancio(v1, v2, axis, border1=0, border2=0):
+	"""
+	Function that attaches one volume to another one, see attach.
+	:param v1: volume to attach the other volume to, VolumeSpec
+	:param v2: volume to attach to the other volume, VolumeSpec
+	:param axis: axis along which the volume will be attached, 0 - x, 1 - y
+	:param border1: max or min side of the axis, 0 - min, 1 - max
+	:param border2: max or min side of the opposite axis, 0 - min, 1 - max
+	:return:
+	"""
+	location = list(v2.location)
+	location[axis], location[abs(1 - axis)] = attach(v1.bounds[:, :2].T, v2.extent,
+	                                                 axis, border1, border2)
+	v2.location = tuple(location)
+
+
+def _rotate(volume):
+	volume.rotation = 90
+
+
+class SpecFactory:
+	"""
+	Factory that produces building specs with the typology rules of the
+	building classes in generator.py.
+	"""
+	def __init__(self):
+		self.mapping = {'Patio': (self._patio, 4),
+		                'L': (self._l, 2),
+		                'C': (self._c, 3),
+		                'Single': (self._single, 1),
+		                'Skyscraper': (self._skyscraper, 1),
+		                'Closedpatio': (self._closed_patio, 2),
+		                'Equalpatio': (self._equal_patio, 4)}
+		self.mapping = {x: y for x, y in self.mapping.items() if x in BUILDINGS}
+		self.patio_width = [3, 12]
+
+	def produce(self, name=None, modules=True):
+		"""
+		Function that produces a building spec.
+		:param name: building typology, str, default None - random
+		:param modules: whether to lay out the modules, bool, default True
+		:return: building spec, BuildingSpec
+		"""
+		if name:
+			name = name.lower().capitalize()
+			assert name in list(self.mapping.keys()), "{} building typology " \
+			                                          "does not exist".format(name)
+		else:
+			name = np.random.choice(list(self.mapping.keys()))
+		volumes = [self._volume() for _ in range(self.mapping[name][1])]
+		spec = BuildingSpec(name, self.mapping[name][0](volumes))
+		if modules:
+			for v in spec.volumes:
+				v.modules = self._modules(v)
+		return spec
+
+	def _volume(self):
+		"""
+		Function that produces a volume with random dimensions, as
+		volume.Factory does.
+		:return: volume, VolumeSpec
+		"""
+		scale = (np.random.randint(MIN_LENGTH, MAX_LENGTH),
+		         np.random.randint(MIN_WIDTH, MAX_WIDTH),
+		         np.random.randint(MIN_HEIGHT, MAX_HEIGHT))
+		return VolumeSpec(max(MIN_WIDTH, scale[0]), max(MIN_LENGTH, scale[1]),
+		                  max(MIN_HEIGHT, scale[2]), 2.7 + round(np.random.random(), 1))
+
+	def _modules(self, volume):
+		"""
+		Function that chooses the modules of every facade of a volume and lays
+		out their grids, as Volume.add_modules does.
+		:param volume: volume, VolumeSpec
+		:return: modules, list of ModuleSpec
+		"""
+		modules = []
+		for module_name in list(MODULES.keys()):
+			n = 2
+			prob = 0.75
+			if module_name == 'roof':
+				n = 1
+				prob = 1
+			for axis in range(n):
+				for side in range(n):
+					x_step = np.random.randint(2, 6)
+					if np.random.random() <= prob:
+						kind = np.random.choice(MODULE_KINDS[module_name])
+						scale, y_offset = MODULE_SHAPES[kind]
+						step = (x_step, volume.floor)
+						positions = applier_positions(
+							MODULES[module_name]['rule'], axis, scale, y_offset,
+							volume.extent[abs(1 - axis)], volume.height,
+							MODULE_OFFSET, step)
+						modules.append(ModuleSpec(module_name, str(kind), axis, side,
+						                          step, positions))
+		return modules
+
+	def _single(self, volumes):
+		return volumes
+
+	def _skyscraper(self, volumes):
+		for v in volumes:
+			v.height = float(np.random.randint(50, 100))
+			v.length = max(30.0, v.length)
+			v.width = max(30.0, v.width)
+		return volumes
+
+	def _l(self, volumes):
+		if np.random.random() < 0.5:  # same height
+			_height = max(min(volumes[0].height, min(volumes[0].width * 3, MAX_HEIGHT)),
+			              MIN_HEIGHT)
+			for v in volumes:
+				v.height = _height
+		volumes = sorted(volumes, key=lambda x: x.length, reverse=True)
+		if len(volumes) == 2:
+			link_l(volumes, gancio)
+		return volumes
+
+	def _c(self, volumes):
+		if np.random.random() < 0.5:  # same height
+			_height = max(min(volumes[0].height, min(volumes[0].width * 3, MAX_HEIGHT)),
+			              MIN_HEIGHT)
+			for v in volumes:
+				v.height = _height
+		volumes = sorted(volumes, key=lambda x: x.length, reverse=True)
+		link_c(volumes, gancio, _rotate)
+		return volumes
+
+	def _patio(self, volumes):
+		volumes = self._patio_volumes(volumes)
+		return self._link(sorted(volumes, key=lambda x: x.length))
+
+	def _equal_patio(self, volumes):
+		_height = max(min(volumes[0].height, min(volumes[0].width * 3, MAX_HEIGHT)),
+		              MIN_HEIGHT)
+		volumes = self._patio_volumes(volumes, _height)
+		return self._link(sorted(volumes, key=lambda x: x.length))
+
+	def _closed_patio(self, volumes):
+		volumes = self._patio_volumes(volumes)
+		for v in volumes[:2]:
+			volumes.append(VolumeSpec(max(MIN_WIDTH, v.width), max(MIN_LENGTH, v.length),
+			                          max(MIN_HEIGHT, v.height),
+			                          2.7 + round(np.random.random(), 1)))
+		return self._link(volumes)
+
+	def _patio_volumes(self, volumes, height=None):
+		for v in volumes:
+			v.width = float(min(max(v.width, self.patio_width[0]), self.patio_width[1]))
+			v.length = v.width * (np.random.random() + 1.5)
+			v.height = height or max(min(v.height, min(v.width * 3, MAX_HEIGHT)),
+			                         MIN_HEIGHT)
+		return volumes
+
+	def _link(self, volumes):
+		"""
+		Function that links the volumes of a patio building, as Patio.make does.
+		:param volumes: volumes, list of VolumeSpec
+		:return: volumes, list of VolumeSpec
+		"""
+		link_patio(volumes, gancio, _rotate)
+		return volumes
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: python spec.py --number 1000 --output specs.jsonl
+
+		------------------------------------------------------------------------
+
+		This is a generator of building specs that does not need Blender. The
+		specs are written one per line, duplicates are skipped.
+
+		------------------------------------------------------------------------
+
+		'''), formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--number', type=int, default=100, help='number of specs')
+	parser.add_argument('--output', type=str, default='specs.jsonl',
+	                    help='file to append the specs to')
+	parser.add_argument('--seed', type=int, default=None, help='seed of the run')
+	args = parser.parse_args()
+
+	if args.seed is not None:
+		np.random.seed(args.seed)
+	factory = SpecFactory()
+	keys = set()
+	if os.path.isfile(args.output):
+		with open(args.output) as f:
+			keys = {BuildingSpec.from_json(x).key() for x in f if x.strip()}
+	with open(args.output, 'a') as f:
+		written = 0
+		while written < args.number:
+			spec = factory.produce()
+			if spec.key() in keys:
+				continue
+			keys.add(spec.key())
+			f.write(spec.json() + '\n')
+			written += 1
+	print('{} specs written to {}'.format(args.number, args.output))
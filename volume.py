@@ -108,6 +108,8 @@ class Volume:
 		self.name = ''
 		self.mesh = None
 		self.modules = []  # replace with blender hierarchy
+		self.index = None  # SpatialIndex of the building
+		self.spec = None  # VolumeSpec the volume is realised from
 
 	def __copy__(self):
 		position = list(self.mesh.location[:2])
@@ -120,6 +122,11 @@ class Volume:
 		return v
 
 	def add_modules(self):
+		if self.index is not None:
+			self.index.index_volumes()
+		if self.spec is not None:
+			self._realise_modules()
+			return
 		for module_name in list(MODULES.keys()):
 			n = 2
 			prob = 0.75
@@ -151,6 +158,21 @@ class Volume:
 						mod.apply(module, step=step, offset=(2.0, 1.0, 2.0, 1.0))
 		# self._check_overlap()
 
+	def _realise_modules(self):
+		"""
+		Function that adds the modules described by the spec of the volume.
+		:return:
+		"""
+		for module_spec in self.spec.modules:
+			module = ModuleFactory().produce_kind(module_spec.kind)(volume=self)
+			module.connect(axis=module_spec.axis, side=module_spec.side)
+			try:
+				module.apply()
+			except Exception as e:
+				print(repr(e))
+			mod = ApplierFactory().produce(module_spec.name)(type(module))
+			mod.realise(module, module_spec.positions)
+
 	def apply(self, material):
 		assert isinstance(material, Material), 'Expected Material object, got ' \
 		                                       '{}'.format(type(material))
@@ -167,13 +189,24 @@ class Volume:
 		:return:
 		"""
 		deselect_all()
-		bpy.ops.mesh.primitive_plane_add(location=self.position)
-		bpy.ops.transform.resize(value=(self.length, self.width, 1.0))
-		bpy.context.selected_objects[0].name = 'volume'
-		self.name = bpy.context.selected_objects[0].name
-		self.mesh = bpy.data.objects[self.name]
-		self._nest()
-		self._extrude()
+		if MESH_BUILDER == 'numpy':
+			# same object transform as the operators: a 2 x 2 plane resized on
+			# the object to (length, width, 1), extruded to the height, origin at
+			# the center of the bounds
+			self.mesh = box_mesh('volume', (2.0, 2.0, self.height),
+			                     location=(self.position[0], self.position[1],
+			                               self.position[2] + self.height / 2))
+			self.mesh.scale = (self.length, self.width, 1.0)
+			self.name = self.mesh.name
+			self._nest()
+		else:
+			bpy.ops.mesh.primitive_plane_add(location=self.position)
+			bpy.ops.transform.resize(value=(self.length, self.width, 1.0))
+			bpy.context.selected_objects[0].name = 'volume'
+			self.name = bpy.context.selected_objects[0].name
+			self.mesh = bpy.data.objects[self.name]
+			self._nest()
+			self._extrude()
 		self.mesh["inst_id"] = 1  # instance id for the building envelope
 		self.mesh.pass_index = 1
 		deselect_all()
@@ -212,7 +245,7 @@ class Volume:
 
 	def _triangulate(self):
 		deselect_all()
-		if self.mesh:
+		if self.mesh and not triangulated(self.mesh):
 			select(self.mesh)
 			bpy.ops.object.modifier_add(type='TRIANGULATE')
 			bpy.ops.object.modifier_apply()